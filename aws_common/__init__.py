@@ -0,0 +1,5 @@
+"""Helpers shared by the scripts in this repository.
+
+Each script directory is deployed as its own Lambda function; package this
+directory alongside the script (at the root of the deployment zip).
+"""
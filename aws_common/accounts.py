@@ -0,0 +1,93 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from aws_common.clients import get_client, release_account_clients
+from aws_common.regions import get_regions
+
+# "all" scans every active account in the organization, a comma-separated list scans those accounts;
+# unset scans only the account the script runs in
+ORG_ACCOUNTS = os.getenv("ORG_ACCOUNTS", "").strip()
+ORG_MAX_WORKERS = int(os.getenv("ORG_MAX_WORKERS", "32"))  # (account, region) pairs scanned in parallel
+
+
+def list_organization_accounts():
+    """Return the IDs of every active account in the organization, sorted."""
+    paginator = get_client("organizations").get_paginator("list_accounts")
+    return sorted(
+        account["Id"] for page in paginator.paginate() for account in page["Accounts"] if account["Status"] == "ACTIVE"
+    )
+
+
+def get_scan_accounts():
+    """Return the account IDs named by ORG_ACCOUNTS, or [] when only the current account is scanned."""
+    if not ORG_ACCOUNTS:
+        return []
+    if ORG_ACCOUNTS.lower() == "all":
+        return list_organization_accounts()
+    return sorted({account.strip() for account in ORG_ACCOUNTS.split(",") if account.strip()})
+
+
+def _account_regions(account_id):
+    try:
+        return get_regions(account_id)
+    except ClientError as e:
+        print(f"Skipping account {account_id}: {e}")
+        return []
+
+
+def list_account_regions(account_ids, regions=None, max_workers=ORG_MAX_WORKERS):
+    """Return the (account_id, region) pairs to scan, in account then region order.
+
+    Regions default to those enabled in each account, looked up concurrently.
+    """
+    account_ids = list(account_ids)
+    if regions:
+        return [(account_id, region) for account_id in account_ids for region in regions]
+    if not account_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        account_regions = list(pool.map(_account_regions, account_ids))
+    for account_id, names in zip(account_ids, account_regions):
+        if not names:
+            release_account_clients(account_id)
+    return [(account_id, region) for account_id, names in zip(account_ids, account_regions) for region in names]
+
+
+def releasing_clients(scan, pairs):
+    """Wrap scan(account_id, region) to release an account's clients once its last pair in pairs is done.
+
+    Keeps memory flat however many accounts the organization has.
+    """
+    remaining = {}
+    for account_id, _ in pairs:
+        remaining[account_id] = remaining.get(account_id, 0) + 1
+    lock = threading.Lock()
+
+    def scan_pair(pair):
+        account_id, region = pair
+        try:
+            return scan(account_id, region)
+        finally:
+            with lock:
+                remaining[account_id] -= 1
+                done = remaining[account_id] == 0
+            if done:
+                release_account_clients(account_id)
+    return scan_pair
+
+
+def scan_accounts(scan, account_ids, regions=None, max_workers=ORG_MAX_WORKERS):
+    """Run scan(account_id, region) for every (account, region) pair on one bounded pool.
+
+    Returns [((account_id, region), result)] in account then region order, however
+    long each pair takes.
+    """
+    pairs = list_account_regions(account_ids, regions, max_workers)
+    if not pairs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = list(pool.map(releasing_clients(scan, pairs), pairs))
+    return list(zip(pairs, results))
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+from aws_common.metrics import instrument_client
+
+ASSUME_ROLE_NAME = os.getenv("ORG_ROLE_NAME", "OrganizationAccountAccessRole")  # Role assumed in member accounts
+CREDENTIAL_REFRESH_SECONDS = 300  # Assume the role again this long before the credentials expire
+
+# One client per (service, region, account), shared by every thread and kept across warm Lambda invocations
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+# Assumed-role credentials per member account, reused until shortly before they expire
+_credentials = {}
+_account_locks = {}
+_caller_account = None
+_caller_lock = threading.Lock()
+
+
+def _fresh(credentials):
+    return credentials is not None and credentials["Expiration"].timestamp() - time.time() > CREDENTIAL_REFRESH_SECONDS
+
+
+def get_caller_account():
+    """Return the ID of the account whose credentials the script runs with."""
+    global _caller_account
+    if _caller_account is None:
+        with _caller_lock:
+            if _caller_account is None:
+                _caller_account = get_client("sts").get_caller_identity()["Account"]
+    return _caller_account
+
+
+def get_account_credentials(account_id):
+    """Return credentials for ASSUME_ROLE_NAME in the account, assuming the role only when needed."""
+    credentials = _credentials.get(account_id)
+    if not _fresh(credentials):
+        with _lock:
+            account_lock = _account_locks.setdefault(account_id, threading.Lock())
+        # Accounts are assumed in parallel, each one only once
+        with account_lock:
+            credentials = _credentials.get(account_id)
+            if not _fresh(credentials):
+                response = get_client("sts").assume_role(
+                    RoleArn=f"arn:aws:iam::{account_id}:role/{ASSUME_ROLE_NAME}",
+                    RoleSessionName="aws-scripts-scan",
+                )
+                credentials = _credentials[account_id] = response["Credentials"]
+    return credentials
+
+
+def get_client(service, region=None, account_id=None, max_pool_connections=None):
+    """Return a cached boto3 client for the service and region, creating it on first use.
+
+    With an account_id other than the caller's, the client uses credentials from
+    ASSUME_ROLE_NAME in that account and is rebuilt when they are renewed.
+    max_pool_connections (botocore's default is 10) applies when the client is built;
+    raise it for a client shared by more threads than that.
+    """
+    global _session
+    credentials = None
+    if account_id is not None and account_id != get_caller_account():
+        credentials = get_account_credentials(account_id)
+
+    key = (service, region, account_id)
+    entry = _clients.get(key)
+    if entry is None or entry[1] is not credentials:
+        # boto3 sessions are not thread-safe, so clients are built one at a time
+        with _lock:
+            entry = _clients.get(key)
+            if entry is None or entry[1] is not credentials:
+                if _session is None:
+                    # Imported here so that importing a script does not pay for boto3 until it is used
+                    import boto3
+
+                    _session = boto3.session.Session()
+                options = {}
+                if credentials is not None:
+                    options = {
+                        "aws_access_key_id": credentials["AccessKeyId"],
+                        "aws_secret_access_key": credentials["SecretAccessKey"],
+                        "aws_session_token": credentials["SessionToken"],
+                    }
+                if max_pool_connections:
+                    from botocore.config import Config
+
+                    options["config"] = Config(max_pool_connections=max_pool_connections)
+                # Every call is counted and timed (aws_common/metrics.py)
+                client = instrument_client(_session.client(service, region_name=region, **options))
+                entry = _clients[key] = (client, credentials)
+    return entry[0]
+
+
+def release_account_clients(account_id):
+    """Drop the cached clients of a member account once its scan is done (each holds ~0.4 MB).
+
+    Its credentials stay cached, so a later scan only pays for rebuilding the clients.
+    """
+    with _lock:
+        for key in [key for key in _clients if key[2] == account_id]:
+            del _clients[key]
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from aws_common.mail import send_html_email
+from aws_common.metrics import THROTTLE_ERROR_CODES
+
+SES_MAX_RECIPIENTS = 50  # SES limit on recipients per message
+
+
+class TokenBucket:
+    """Blocking token bucket: tokens refill at rate per second up to capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Wait until the given number of tokens is available, then take them.
+
+        Requests larger than the capacity wait for a full bucket and leave it in debt,
+        so later callers wait for the excess to refill.
+        """
+        needed = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def get_send_rate(ses_client, default=1.0):
+    """Return the account's SES MaxSendRate (messages per second)."""
+    try:
+        return ses_client.get_send_quota()["MaxSendRate"] or default
+    except ClientError as e:
+        print(f"Could not read SES send quota, assuming {default}/s: {e}")
+        return default
+
+
+def partition_by_contact(rows, contact_of):
+    """Group report rows into {contact email: [rows]}, skipping contacts that are not email addresses."""
+    digests = {}
+    for row in rows:
+        contact = contact_of(row)
+        if contact and "@" in contact and "." in contact:
+            digests.setdefault(contact, []).append(row)
+    return digests
+
+
+def _is_throttle(error):
+    code = error.response.get("Error", {}).get("Code", "")
+    message = error.response.get("Error", {}).get("Message", "")
+    return code in THROTTLE_ERROR_CODES or "rate exceeded" in message.lower()
+
+
+def send_with_backoff(ses_client, source, recipients, subject, body_html, bucket=None, base_delay=1.0, max_delay=30.0):
+    """Send one message, retrying throttling errors with exponential backoff until it is accepted."""
+    attempt = 0
+    while True:
+        if bucket is not None:
+            # SES counts every recipient against the send rate
+            bucket.acquire(len(recipients))
+        try:
+            return send_html_email(ses_client, source, recipients, subject, body_html)
+        except ClientError as e:
+            if not _is_throttle(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            print(f"SES throttled sending to {recipients}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def deliver_messages(ses_client, source, messages, max_workers=4, send_rate=None):
+    """Send (recipients, subject, body_html) messages concurrently under the SES send rate.
+
+    Recipient lists longer than 50 are split into several messages. Returns the number of
+    messages accepted by SES; messages that fail for reasons other than throttling are reported.
+    """
+    bucket = TokenBucket(send_rate if send_rate is not None else get_send_rate(ses_client))
+    batches = [
+        (list(recipients)[start:start + SES_MAX_RECIPIENTS], subject, body_html)
+        for recipients, subject, body_html in messages
+        for start in range(0, len(recipients), SES_MAX_RECIPIENTS)
+    ]
+
+    def send(batch):
+        recipients, subject, body_html = batch
+        try:
+            response = send_with_backoff(ses_client, source, recipients, subject, body_html, bucket)
+            print(f"Email sent! Message ID: {response['MessageId']} to {recipients}")
+            return True
+        except ClientError as e:
+            print(f"Error sending email to {recipients}: {e}")
+            return False
+
+    if not batches:
+        return 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+        return sum(pool.map(send, batches))
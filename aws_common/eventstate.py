@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from aws_common.store import open_store
+
+# Directory or "s3://bucket/prefix" for the event state files ("" keeps the state in memory, for warm invocations only)
+EVENT_STATE_LOCATION = os.getenv("EVENT_STATE_LOCATION", os.path.join(tempfile.gettempdir(), "event_state"))
+EVENT_STATE_RESYNC_SECONDS = int(os.getenv("EVENT_STATE_RESYNC_SECONDS", "86400"))  # How often the full upcoming list is re-read
+EVENT_RETRY_LIMIT = int(os.getenv("EVENT_RETRY_LIMIT", "5"))  # Runs that fetch an event's failed details again
+CURSOR_OVERLAP_SECONDS = 300  # Re-read this much before the cursor, for updates that become visible late
+
+
+def _plain(value):
+    """Return value as it reads back from the state file (timestamps become strings)."""
+    return json.loads(json.dumps(value, default=str))
+
+
+def _timestamp(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def event_fingerprint(event):
+    """Return a short hash of an event as listed, which changes whenever the event is updated."""
+    return hashlib.sha256(json.dumps(event, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class EventState:
+    """Upcoming Health events, with the details and entities fetched for them, kept between runs.
+
+    A run lists only the events updated since the cursor (the latest lastUpdatedTime seen),
+    so details and entities are fetched for new or changed events only; everything else is
+    served from the state file. Every EVENT_STATE_RESYNC_SECONDS the full upcoming list is
+    read again, to drop events that went away without an update.
+    """
+
+    def __init__(self, name, location=EVENT_STATE_LOCATION):
+        self.store = open_store(f"{location.rstrip('/')}/{name}.json") if location else None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        data, self._stamp = self.store.read() if self.store else (None, None)
+        state = json.loads(data) if data else {}
+        self.cursor = state.get("cursor")
+        self.synced_at = state.get("synced_at", 0)
+        # event ARN -> {"fingerprint", "event", "data"}, plus "retries" while the data is incomplete
+        self.events = state.get("events", {})
+        self._pending = {}  # event ARN -> (fingerprint, event), listed but without data yet
+        self._pending_cursor = None
+        self._pending_synced_at = None
+        self._dirty = False
+
+    def _reload_if_changed(self):
+        # The polling and push handlers can share the file; a warm container must not save over the other's updates
+        if self.store is not None and self.store.stamp() != self._stamp:
+            self._load()
+
+    def refresh(self, list_events, keep=None):
+        """Bring the event list up to date and return the tracked events, most recently updated first.
+
+        list_events(since) returns the upcoming events when since is None, and otherwise every
+        event (of any status) updated since that ISO timestamp. keep(event) can exclude events.
+        New or updated events are returned too; their data is missing until update().
+        """
+        with self._lock:
+            self._reload_if_changed()
+            full = self.cursor is None or time.time() - self.synced_at >= EVENT_STATE_RESYNC_SECONDS
+            since = None
+            if not full:
+                since = (_timestamp(self.cursor) - timedelta(seconds=CURSOR_OVERLAP_SECONDS)).isoformat()
+            listed = list_events(since)
+
+            if full:
+                listed_arns = {event["arn"] for event in listed}
+                for event_arn in [arn for arn in self.events if arn not in listed_arns]:
+                    del self.events[event_arn]
+                    self._dirty = True
+                self._pending_synced_at = time.time()
+
+            self._pending = {}
+            for event in listed:
+                event_arn = event["arn"]
+                if event.get("statusCode", "upcoming") != "upcoming" or (keep is not None and not keep(event)):
+                    if self.events.pop(event_arn, None) is not None:
+                        self._dirty = True
+                    continue
+                fingerprint = event_fingerprint(event)
+                entry = self.events.get(event_arn)
+                if entry is None or entry["fingerprint"] != fingerprint:
+                    self._pending[event_arn] = (fingerprint, _plain(event))
+
+            updated = [_timestamp(event["lastUpdatedTime"]) for event in listed if event.get("lastUpdatedTime")]
+            if self.cursor:
+                updated.append(_timestamp(self.cursor))
+            self._pending_cursor = max(updated).isoformat() if updated else self.cursor
+
+            # Nothing to fetch: the cursor moves and any removals are saved now
+            self._commit()
+
+            events = {arn: entry["event"] for arn, entry in self.events.items()}
+            events.update((arn, event) for arn, (_, event) in self._pending.items())
+            print(f"Event state: {len(events)} events tracked, {len(self._pending)} new or updated"
+                  f" ({'full list' if full else f'updated since {since}'}).")
+            # Stable sort, so events without lastUpdatedTime keep their listed order
+            return sorted(events.values(), key=lambda event: str(event.get("lastUpdatedTime", "")), reverse=True)
+
+    def get_many(self, event_arns):
+        """Return {event_arn: data} for the events whose data is current.
+
+        Incomplete data counts as current once it has been fetched EVENT_RETRY_LIMIT times.
+        """
+        with self._lock:
+            return {arn: self.events[arn]["data"] for arn in event_arns
+                    if arn in self.events and arn not in self._pending
+                    and self.events[arn].get("retries", EVENT_RETRY_LIMIT) >= EVENT_RETRY_LIMIT}
+
+    def update(self, data_by_arn, incomplete=()):
+        """Store the data fetched for new or updated events and save the state.
+
+        The cursor only moves once every event listed by refresh() has its data, so a run
+        stopped halfway lists the same changes again. Events in incomplete are stored too,
+        so they do not hold the cursor back, but get_many() leaves them out and the next
+        runs fetch them again, up to EVENT_RETRY_LIMIT times.
+        """
+        with self._lock:
+            for event_arn, data in data_by_arn.items():
+                pending = self._pending.pop(event_arn, None)
+                if pending is not None:
+                    fingerprint, event = pending
+                    entry = {"fingerprint": fingerprint, "event": event}
+                elif "retries" in self.events.get(event_arn, {}):
+                    entry = self.events[event_arn]
+                else:
+                    continue
+                entry["data"] = _plain(data)
+                if event_arn in incomplete:
+                    entry["retries"] = entry.get("retries", 0) + 1
+                else:
+                    entry.pop("retries", None)
+                self.events[event_arn] = entry
+                self._dirty = True
+            self._commit()
+
+    def _commit(self):
+        if not self._pending:
+            if self._pending_cursor is not None and self._pending_cursor != self.cursor:
+                self.cursor = self._pending_cursor
+                self._dirty = True
+            if self._pending_synced_at is not None:
+                self.synced_at = self._pending_synced_at
+                self._pending_synced_at = None
+                self._dirty = True
+        self._save()
+
+    def _save(self):
+        if self._dirty and self.store is not None:
+            state = {"cursor": self.cursor, "synced_at": self.synced_at, "events": self.events}
+            self.store.write(json.dumps(state, separators=(",", ":"), default=str).encode())
+            self._stamp = self.store.stamp()
+        self._dirty = False
+
+    def is_current(self, event):
+        """Return whether the event is stored exactly as listed, so it has been handled already."""
+        with self._lock:
+            self._reload_if_changed()
+            entry = self.events.get(event["arn"])
+            return entry is not None and entry["fingerprint"] == event_fingerprint(event)
+
+    def put(self, event, data):
+        """Store one pushed event (from EventBridge) with its data and save the state.
+
+        Returns whether the event was new or changed, so a redelivered notification can be
+        recognized; events that are no longer upcoming are removed. The cursor does not
+        move, so the next poll still lists everything updated since the previous one.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            event_arn = event["arn"]
+            self._pending.pop(event_arn, None)
+            if event.get("statusCode", "upcoming") != "upcoming":
+                changed = self.events.pop(event_arn, None) is not None
+            else:
+                fingerprint = event_fingerprint(event)
+                entry = self.events.get(event_arn)
+                changed = entry is None or entry["fingerprint"] != fingerprint
+                if changed:
+                    self.events[event_arn] = {"fingerprint": fingerprint, "event": _plain(event), "data": _plain(data)}
+            self._dirty = self._dirty or changed
+            self._save()
+            return changed
+
+    def fetch_missing(self, event_arns, fetch, complete=None):
+        """Return {event_arn: data} for the events, calling fetch(arns) only for those without current data.
+
+        fetch may return None (for example when the Lambda deadline stopped it); None is then
+        returned and the state is left as it was. Data for which complete(data) is false (a
+        failed lookup) is fetched again by the next runs, up to EVENT_RETRY_LIMIT times.
+        """
+        data_by_arn = self.get_many(event_arns)
+        missing = [arn for arn in dict.fromkeys(event_arns) if arn not in data_by_arn]
+        if missing:
+            fetched = fetch(missing)
+            if fetched is None:
+                return None
+            self.update(fetched, [arn for arn, data in fetched.items() if complete is not None and not complete(data)])
+            data_by_arn.update(_plain(fetched))
+        return data_by_arn
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def get_event_state(name):
+    """Return the event state of a script, loaded on first use and kept across warm Lambda invocations."""
+    with _states_lock:
+        if name not in _states:
+            _states[name] = EventState(name)
+    return _states[name]
@@ -0,0 +1,147 @@
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from botocore.exceptions import ClientError
+
+HEALTH_EVENT_SOURCE = "aws.health"  # EventBridge source of AWS Health events
+EVENT_DETAILS_BATCH_SIZE = 10  # Max event ARNs per describe_event_details call
+ENTITY_FILTER_BATCH_SIZE = 10  # Max event ARNs per describe_affected_entities filter
+ENTITY_PAGE_SIZE = 100  # Max entities per describe_affected_entities page
+ORG_ENTITY_FILTER_BATCH_SIZE = 10  # Max organizationEntityFilters per describe_affected_entities_for_organization call
+
+
+def fetch_event_details(health_client, event_arns, cache=None):
+    """Return {event_arn: details} for the events, fetching 10 ARNs per describe_event_details call.
+
+    ARNs already in cache are not fetched again, and new results are added to it.
+    Entries in failedSet (and batches that fail outright) are reported and left out,
+    without stopping the remaining batches.
+    """
+    details = cache if cache is not None else {}
+    pending = list(dict.fromkeys(arn for arn in event_arns if arn not in details))
+
+    for start in range(0, len(pending), EVENT_DETAILS_BATCH_SIZE):
+        batch = pending[start:start + EVENT_DETAILS_BATCH_SIZE]
+        try:
+            response = health_client.describe_event_details(eventArns=batch)
+        except ClientError as e:
+            print(f"Error fetching event details for {len(batch)} events: {e}")
+            continue
+
+        for item in response.get("successfulSet", []):
+            details[item["event"]["arn"]] = item
+        for failure in response.get("failedSet", []):
+            print(f"Error fetching event details for {failure.get('eventArn')}: "
+                  f"{failure.get('errorName')} {failure.get('errorMessage')}")
+
+    return details
+
+
+def iter_affected_entities(health_client, event_arns):
+    """Yield (event_arn, entity) for every entity affected by the events.
+
+    Up to 10 events are queried per request and every page is followed, so the
+    number of calls grows with the number of entity pages rather than events.
+    """
+    paginator = health_client.get_paginator("describe_affected_entities")
+    event_arns = list(dict.fromkeys(event_arns))
+
+    for start in range(0, len(event_arns), ENTITY_FILTER_BATCH_SIZE):
+        batch = event_arns[start:start + ENTITY_FILTER_BATCH_SIZE]
+        pages = paginator.paginate(
+            filter={"eventArns": batch},
+            PaginationConfig={"PageSize": ENTITY_PAGE_SIZE},
+        )
+        for page in pages:
+            for entity in page.get("entities", []):
+                yield entity["eventArn"], entity
+
+
+def group_affected_entities(entity_pairs):
+    """Collect (key, entity) pairs, such as (event_arn, entity), into {key: [entity values]}."""
+    grouped = {}
+    for key, entity in entity_pairs:
+        grouped.setdefault(key, []).append(entity["entityValue"])
+    return grouped
+
+
+def get_organization_affected_accounts(health_client, event_arn):
+    """Return every account affected by an organization event, following pagination."""
+    paginator = health_client.get_paginator("describe_affected_accounts_for_organization")
+    accounts = []
+    for page in paginator.paginate(eventArn=event_arn):
+        accounts.extend(page.get("affectedAccounts", []))
+    return accounts
+
+
+def plan_organization_entity_batches(pairs):
+    """Split (event_arn, account_id) pairs into lists of at most 10 organizationEntityFilters."""
+    pairs = list(dict.fromkeys(pairs))
+    return [
+        [{"eventArn": event_arn, "awsAccountId": account_id} for event_arn, account_id in pairs[start:start + ORG_ENTITY_FILTER_BATCH_SIZE]]
+        for start in range(0, len(pairs), ORG_ENTITY_FILTER_BATCH_SIZE)
+    ]
+
+
+def iter_organization_entity_batch(health_client, filters):
+    """Yield ((event_arn, account_id), entity) for one batch of organizationEntityFilters, following pagination."""
+    paginator = health_client.get_paginator("describe_affected_entities_for_organization")
+    pages = paginator.paginate(
+        organizationEntityFilters=filters,
+        PaginationConfig={"PageSize": ENTITY_PAGE_SIZE},
+    )
+    for page in pages:
+        for entity in page.get("entities", []):
+            yield (entity["eventArn"], entity["awsAccountId"]), entity
+        for failure in page.get("failedSet", []):
+            print(f"Error fetching affected entities for {failure.get('eventArn')} in "
+                  f"{failure.get('awsAccountId')}: {failure.get('errorName')} {failure.get('errorMessage')}")
+
+
+def iter_organization_entities(health_client, pairs):
+    """Yield ((event_arn, account_id), entity) for the affected entities of each pair, 10 pairs per request."""
+    for filters in plan_organization_entity_batches(pairs):
+        yield from iter_organization_entity_batch(health_client, filters)
+
+
+def _notification_time(value):
+    """Parse an EventBridge AWS Health timestamp ("Sat, 28 Jan 2023 00:00:00 GMT", or ISO 8601)."""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def parse_health_notification(notification):
+    """Turn an AWS Health event delivered by EventBridge into (event, description, entities).
+
+    event has the fields describe_events returns, so it can be kept next to polled events.
+    description is the latest (English, when there is a choice) description and entities
+    the affected entities as [{"entityValue", "tags"}]; either is None when the
+    notification does not carry it. Raises ValueError for events from any other source.
+    """
+    if not isinstance(notification, dict) or notification.get("source") != HEALTH_EVENT_SOURCE:
+        source = notification.get("source") if isinstance(notification, dict) else type(notification).__name__
+        raise ValueError(f"not an AWS Health event (source {source})")
+    detail = notification.get("detail", {})
+
+    event = {
+        "arn": detail["eventArn"],
+        "service": detail.get("service"),
+        "eventTypeCode": detail.get("eventTypeCode"),
+        "eventTypeCategory": detail.get("eventTypeCategory"),
+        "region": detail.get("eventRegion", notification.get("region")),
+        "startTime": _notification_time(detail.get("startTime")),
+        "endTime": _notification_time(detail.get("endTime")),
+        "lastUpdatedTime": _notification_time(detail.get("lastUpdatedTime")) or _notification_time(notification.get("time")),
+        "statusCode": detail.get("statusCode"),
+        "eventScopeCode": detail.get("eventScopeCode"),
+    }
+    event = {key: value for key, value in event.items() if value is not None}
+
+    descriptions = detail.get("eventDescription") or []
+    description = next((item for item in descriptions if item.get("language") == "en_US"), descriptions[0] if descriptions else None)
+    entities = detail.get("affectedEntities")
+    return event, description.get("latestDescription") if description else None, entities
@@ -0,0 +1,40 @@
+from email.charset import QP, Charset
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+def build_raw_message(source, recipients, subject, body_html, attachments=()):
+    """Return a MIME message (bytes) with an HTML body and (filename, data, mime type) attachments."""
+    message = MIMEMultipart("mixed")
+    message["Subject"] = subject
+    message["From"] = source
+    message["To"] = ", ".join(recipients)
+    # Quoted-printable keeps mostly-ASCII HTML close to its size; base64 would add a third
+    charset = Charset("utf-8")
+    charset.body_encoding = QP
+    message.attach(MIMEText(body_html, "html", charset))
+    for filename, data, mime_type in attachments:
+        part = MIMEApplication(data, _subtype=mime_type.split("/", 1)[-1])
+        part.add_header("Content-Disposition", "attachment", filename=filename)
+        message.attach(part)
+    return message.as_bytes()
+
+
+def send_html_email(ses_client, source, recipients, subject, body_html):
+    """Send an HTML email via SES, as a raw message when the body carries attachments."""
+    attachments = getattr(body_html, "attachments", ())
+    if attachments:
+        return ses_client.send_raw_email(
+            Source=source,
+            Destinations=list(recipients),
+            RawMessage={"Data": build_raw_message(source, recipients, subject, str(body_html), attachments)},
+        )
+    return ses_client.send_email(
+        Source=source,
+        Destination={"ToAddresses": list(recipients)},
+        Message={
+            "Subject": {"Data": subject},
+            "Body": {"Html": {"Data": str(body_html)}},
+        },
+    )
@@ -0,0 +1,154 @@
+import functools
+import json
+import os
+import threading
+import time
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "AwsScripts")  # CloudWatch namespace of the emitted metrics
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # Upper bounds of the latency histogram
+THROTTLE_ERROR_CODES = {"Throttling", "ThrottlingException", "TooManyRequestsException"}
+
+
+class ApiMetrics:
+    """Per-operation call counts, errors, retries, throttles and latency histograms, safe across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}
+
+    def _operation(self, name):
+        operation = self.operations.get(name)
+        if operation is None:
+            operation = self.operations[name] = {
+                "calls": 0, "errors": 0, "retries": 0, "throttles": 0,
+                "latency_total_ms": 0.0, "latency_max_ms": 0.0,
+                "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        return operation
+
+    def record_call(self, name, latency_ms, error_code=None, retries=0):
+        with self._lock:
+            operation = self._operation(name)
+            operation["calls"] += 1
+            operation["retries"] += retries
+            operation["latency_total_ms"] += latency_ms
+            operation["latency_max_ms"] = max(operation["latency_max_ms"], latency_ms)
+            bucket = next((n for n, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), len(LATENCY_BUCKETS_MS))
+            operation["histogram"][bucket] += 1
+            if error_code is not None:
+                operation["errors"] += 1
+
+    def record_throttled_attempt(self, name):
+        """Count one throttled attempt, whether or not botocore retries it."""
+        with self._lock:
+            self._operation(name)["throttles"] += 1
+
+    def emf_lines(self, script):
+        """Return one CloudWatch Embedded Metric Format line per operation called."""
+        timestamp = int(time.time() * 1000)
+        labels = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + [f"gt_{LATENCY_BUCKETS_MS[-1]}ms"]
+        lines = []
+        with self._lock:
+            for name, operation in sorted(self.operations.items()):
+                calls = operation["calls"]
+                lines.append(json.dumps({
+                    "_aws": {
+                        "Timestamp": timestamp,
+                        "CloudWatchMetrics": [{
+                            "Namespace": METRICS_NAMESPACE,
+                            "Dimensions": [["Script", "Operation"]],
+                            "Metrics": [
+                                {"Name": "Calls", "Unit": "Count"},
+                                {"Name": "Errors", "Unit": "Count"},
+                                {"Name": "Retries", "Unit": "Count"},
+                                {"Name": "Throttles", "Unit": "Count"},
+                                {"Name": "LatencyAvg", "Unit": "Milliseconds"},
+                                {"Name": "LatencyMax", "Unit": "Milliseconds"},
+                            ],
+                        }],
+                    },
+                    "Script": script,
+                    "Operation": name,
+                    "Calls": calls,
+                    "Errors": operation["errors"],
+                    "Retries": operation["retries"],
+                    "Throttles": operation["throttles"],
+                    "LatencyAvg": round(operation["latency_total_ms"] / calls, 2) if calls else 0.0,
+                    "LatencyMax": round(operation["latency_max_ms"], 2),
+                    # Not a metric; queryable with CloudWatch Logs Insights
+                    "LatencyHistogram": dict(zip(labels, operation["histogram"])),
+                }, separators=(",", ":")))
+        return lines
+
+
+_metrics = ApiMetrics()
+
+
+def get_metrics():
+    """Return the process-wide ApiMetrics shared by every client from aws_common.clients."""
+    return _metrics
+
+
+def _operation_name(model):
+    return f"{model.service_model.service_name}.{model.name}"
+
+
+def _before_call(model, context, **kwargs):
+    # after-call-error does not carry the operation model, so its name is kept in the request context
+    context["metrics_operation"] = _operation_name(model)
+    context["metrics_started"] = time.perf_counter()
+
+
+def _after_call(model, http_response, parsed, context, **kwargs):
+    started = context.get("metrics_started")
+    if started is None:
+        return
+    error_code = parsed.get("Error", {}).get("Code") if http_response.status_code >= 300 else None
+    retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    _metrics.record_call(_operation_name(model), (time.perf_counter() - started) * 1000, error_code, retries)
+
+
+def _after_call_error(exception, context, **kwargs):
+    started = context.get("metrics_started")
+    if started is None:
+        return
+    _metrics.record_call(context["metrics_operation"], (time.perf_counter() - started) * 1000,
+                         type(exception).__name__)
+
+
+def _needs_retry(response, operation, attempts, **kwargs):
+    if response is not None:
+        error_code = response[1].get("Error", {}).get("Code")
+        if error_code in THROTTLE_ERROR_CODES:
+            _metrics.record_throttled_attempt(_operation_name(operation))
+    # Returning None leaves the retry decision to botocore
+
+
+def instrument_client(client):
+    """Register the metrics hooks on a boto3 client."""
+    events = client.meta.events
+    # Registered first, so the clock starts before any other before-call handler answers the call
+    events.register_first("before-call", _before_call)
+    events.register("after-call", _after_call)
+    events.register("after-call-error", _after_call_error)
+    events.register("needs-retry", _needs_retry)
+    return client
+
+
+def emit_metrics(script):
+    """Decorate a Lambda handler: reset the metrics on entry and print them as EMF lines on exit."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            _metrics.reset()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                for line in _metrics.emf_lines(script):
+                    print(line)
+        return wrapper
+    return decorator
@@ -0,0 +1,101 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+from aws_common.store import open_store
+
+# Directory or "s3://bucket/prefix" to write profiles to; profiling is off when unset
+PROFILE_LOCATION = os.getenv("PROFILE_LOCATION", "")
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25"))  # Allocation sites listed in the summary
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))  # Functions listed in the summary, by cumulative time
+
+_active = threading.Lock()
+
+
+def _peak_rss_mb():
+    import resource
+
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _run_id(script, context):
+    request_id = getattr(context, "aws_request_id", None) or uuid.uuid4().hex[:12]
+    return f"{script}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{request_id}"
+
+
+def _profile(script, handler, args, kwargs):
+    import cProfile
+    import io
+    import pstats
+    import tempfile
+    import tracemalloc
+
+    context = args[1] if len(args) > 1 else kwargs.get("context")
+    run_id = _run_id(script, context)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        return handler(*args, **kwargs)
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        top_functions = io.StringIO()
+        pstats.Stats(profiler, stream=top_functions).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        summary = {
+            "run_id": run_id,
+            "script": script,
+            "wall_seconds": round(elapsed, 3),
+            "peak_rss_mb": _peak_rss_mb(),
+            "peak_traced_mb": round(traced_peak / (1024 * 1024), 1),
+            "top_allocations": [
+                {"site": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]
+            ],
+            "top_functions": top_functions.getvalue(),
+        }
+
+        # pstats only dumps to a file, so the binary profile goes through a temporary one
+        with tempfile.NamedTemporaryFile(suffix=".prof") as f:
+            profiler.dump_stats(f.name)
+            profile_data = f.read()
+
+        location = PROFILE_LOCATION.rstrip("/")
+        try:
+            open_store(f"{location}/{run_id}.prof").write(profile_data)
+            open_store(f"{location}/{run_id}.json").write(json.dumps(summary, indent=2).encode())
+            print(f"Profile written to {location}/{run_id}.prof (peak RSS {summary['peak_rss_mb']} MB)")
+        except Exception as e:
+            # A failed upload must not turn a successful run into a failed one
+            print(f"Error writing profile {run_id} to {location}: {e}")
+
+
+def profile_handler(script):
+    """Decorate a handler to write a cProfile dump, top allocation sites and peak RSS per run.
+
+    Only when PROFILE_LOCATION is set; otherwise the handler is returned undecorated.
+    """
+    def decorator(handler):
+        if not PROFILE_LOCATION:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            # Nested profiled calls (lambda_handler -> main) are profiled once, by the outermost
+            if not _active.acquire(blocking=False):
+                return handler(*args, **kwargs)
+            try:
+                return _profile(script, handler, args, kwargs)
+            finally:
+                _active.release()
+        return wrapper
+    return decorator
@@ -0,0 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_common.clients import get_client
+
+
+def get_regions(account_id=None):
+    """Return the names of all regions enabled for the account (the caller's by default), sorted."""
+    response = get_client("ec2", None, account_id).describe_regions()
+    return sorted(region["RegionName"] for region in response["Regions"])
+
+
+def scan_regions(scan, regions, max_workers=10):
+    """Run scan(region) for every region concurrently and return the results in region order."""
+    regions = list(regions)
+    if not regions:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(regions)))) as pool:
+        return list(pool.map(scan, regions))
@@ -0,0 +1,185 @@
+import csv
+import gzip
+import html
+import io
+import os
+
+# SES rejects messages over 10 MB after encoding; budget for the encoded message (the quoted-printable
+# HTML plus the base64 attachments), leaving room for the headers
+REPORT_MAX_BYTES = int(os.getenv("REPORT_MAX_BYTES", str(9 * 1000 * 1000)))
+# Optional cap on the rows shown in the email body (0 means no cap)
+REPORT_MAX_ROWS = int(os.getenv("REPORT_MAX_ROWS", "0"))
+
+TABLE_ATTRS = 'border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; width: 100%;"'
+
+
+def encoded_html_size(markup):
+    """Return an upper bound on the quoted-printable size of markup, as aws_common.mail encodes it."""
+    data_bytes = len(markup.encode("utf-8"))
+    # "=" and every byte of a non-ASCII character become three characters ("=XX")
+    escaped = markup.count("=") + 2 * (data_bytes - len(markup))
+    size = data_bytes + 2 * escaped
+    return size + 3 * (size // 75 + 1)  # Soft line breaks ("=" and a newline) every 76 characters
+
+
+def encoded_attachment_size(data):
+    """Return the base64 size of an attachment, with its line breaks."""
+    size = 4 * ((len(data) + 2) // 3)
+    return size + 2 * (size // 76 + 1)
+
+
+class HtmlDocument(str):
+    """Rendered HTML, carrying any (filename, bytes, mime type) attachments that belong with it."""
+
+    def __new__(cls, value, attachments=()):
+        document = super().__new__(cls, value)
+        document.attachments = list(attachments)
+        return document
+
+
+class HtmlReport:
+    """Builds an HTML report in one pass into a buffer, escaping table cells.
+
+    Once the encoded body reaches max_bytes (or max_rows rows), further rows are left out
+    of the HTML and the complete tables are attached as a gzip CSV instead. The attachment
+    counts against max_bytes too, so render() leaves out more rows when needed.
+    """
+
+    def __init__(self, name, max_bytes=REPORT_MAX_BYTES, max_rows=REPORT_MAX_ROWS):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.size = 0
+        self.encoded_size = 0
+        self.rows_shown = 0
+        self.rows_total = 0
+        self._buffer = io.StringIO()
+        self._length = 0  # Characters in the buffer
+        self._shown = []  # (start, end, encoded size, table) of every row in the HTML
+        self._notes = []  # (position, table) of the "more rows" note of every table
+        self._csv = {}  # headers -> (gzip file, text stream, csv writer)
+
+    @property
+    def truncated(self):
+        return self.rows_shown < self.rows_total
+
+    def raw(self, markup):
+        """Append trusted markup, such as the surrounding template."""
+        self._write(markup)
+
+    def _write(self, markup):
+        self._buffer.write(markup)
+        self._length += len(markup)
+        self.size += len(markup.encode("utf-8"))
+        self.encoded_size += encoded_html_size(markup)
+
+    def text(self, value):
+        """Append escaped text."""
+        self.raw(html.escape(str(value)))
+
+    def table(self, headers, caption="", attrs=TABLE_ATTRS, header_row_attrs=""):
+        """Start a table; use the result as a context manager and add rows with row()."""
+        return _Table(self, headers, caption, attrs, header_row_attrs)
+
+    def _csv_writer(self, headers):
+        key = tuple(headers)
+        if key not in self._csv:
+            compressed = io.BytesIO()
+            gzip_file = gzip.GzipFile(fileobj=compressed, mode="wb")
+            stream = io.TextIOWrapper(gzip_file, encoding="utf-8", newline="")
+            writer = csv.writer(stream)
+            writer.writerow(["Table"] + list(headers))
+            self._csv[key] = (compressed, stream, writer)
+        return self._csv[key][2]
+
+    def _has_room(self, row_encoded):
+        if self.max_rows and self.rows_shown >= self.max_rows:
+            return False
+        return self.rows_shown == self.rows_total and self.encoded_size + row_encoded <= self.max_bytes
+
+    def render(self):
+        """Return the finished HtmlDocument, with the full tables attached if rows were left out."""
+        attachments = []
+        for index, (compressed, stream, _) in enumerate(self._csv.values()):
+            stream.close()  # flushes and finishes the gzip stream, leaving the BytesIO open
+            if self.truncated:
+                suffix = f"-{index + 1}" if len(self._csv) > 1 else ""
+                attachments.append((f"{self.name}{suffix}.csv.gz", compressed.getvalue(), "application/gzip"))
+        self._csv = {}
+
+        # Leave out the last rows shown until the body and the attachments fit together
+        note_reserve = 200 * len(self._notes)
+        budget = self.max_bytes - sum(encoded_attachment_size(data) for _, data, _ in attachments) - note_reserve
+        dropped = 0
+        while self._shown[:len(self._shown) - dropped] and attachments and self.encoded_size > budget:
+            _, _, row_encoded, table = self._shown[len(self._shown) - 1 - dropped]
+            self.encoded_size -= row_encoded
+            table.omitted += 1
+            dropped += 1
+        if dropped:
+            print(f"Report {self.name}: {dropped} more rows left out to fit the {len(attachments)} attachments.")
+        if budget < 0:
+            print(f"Report {self.name}: the attachments alone exceed {self.max_bytes} bytes; SES may reject the email.")
+        self.rows_shown -= dropped
+
+        # Splice out the dropped rows and add the notes, in buffer order
+        body = self._buffer.getvalue()
+        edits = [(start, end, None) for start, end, _, _ in self._shown[len(self._shown) - dropped:]]
+        edits += [(position, position, table) for position, table in self._notes]
+        parts = []
+        position = 0
+        for start, end, table in sorted(edits, key=lambda edit: (edit[0], edit[2] is not None)):
+            parts.append(body[position:start])
+            position = end
+            if table is not None and table.omitted:
+                parts.append(table.note())
+        parts.append(body[position:])
+        self._shown = []
+        self._notes = []
+        return HtmlDocument("".join(parts), attachments)
+
+
+class _Table:
+    def __init__(self, report, headers, caption, attrs, header_row_attrs):
+        self.report = report
+        self.headers = headers
+        self.caption = caption
+        self.attrs = attrs
+        self.header_row_attrs = header_row_attrs
+        self.omitted = 0
+
+    def __enter__(self):
+        header_cells = "".join(f"<th>{html.escape(str(header))}</th>" for header in self.headers)
+        table_attrs = f" {self.attrs}" if self.attrs else ""
+        row_attrs = f" {self.header_row_attrs}" if self.header_row_attrs else ""
+        self.report.raw(f"<table{table_attrs}><thead><tr{row_attrs}>{header_cells}</tr></thead><tbody>")
+        return self
+
+    def row(self, cells, cell_attrs=None):
+        """Add a row; cells are escaped, cell_attrs optionally gives raw attributes per cell."""
+        report = self.report
+        report._csv_writer(self.headers).writerow([self.caption] + ["" if cell is None else cell for cell in cells])
+
+        cell_attrs = cell_attrs or [""] * len(cells)
+        markup = "<tr>" + "".join(
+            f"<td{' ' + attrs if attrs else ''}>{html.escape(str(cell))}</td>" for cell, attrs in zip(cells, cell_attrs)
+        ) + "</tr>"
+        row_encoded = encoded_html_size(markup)
+        if report._has_room(row_encoded):
+            start = report._length
+            report._write(markup)
+            report._shown.append((start, report._length, row_encoded, self))
+            report.rows_shown += 1
+        else:
+            self.omitted += 1
+        report.rows_total += 1
+
+    def note(self):
+        return (f"<p><em>{self.omitted} more rows are not shown here; "
+                f"the complete table is attached as a compressed CSV file.</em></p>")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.report.raw("</tbody></table>")
+        # Written by render(), once it is known how many rows were left out
+        self.report._notes.append((self.report._length, self))
+        return False
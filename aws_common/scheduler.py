@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from aws_common.clients import get_client
+from aws_common.store import open_store
+
+# Directory or "s3://bucket/prefix" for checkpoints of runs stopped before the Lambda deadline
+CHECKPOINT_LOCATION = os.getenv("CHECKPOINT_LOCATION", os.path.join(tempfile.gettempdir(), "checkpoints"))
+DEADLINE_MARGIN_MS = int(os.getenv("DEADLINE_MARGIN_MS", "120000"))  # Stop starting work this long before the timeout
+# "invoke" re-invokes the function asynchronously to continue; "return" only returns the continuation token
+CONTINUATION_MODE = os.getenv("CONTINUATION_MODE", "invoke")
+CONTINUATION_KEY = "continuation"  # Event key carrying the token of the run to resume
+
+
+class DeadlineScheduler:
+    """Runs units of work until the Lambda deadline approaches, checkpointing what is done.
+
+    Each unit (a JSON-serializable value such as a region or an (account, region) pair)
+    runs once; its encoded result is kept in a checkpoint so that a resumed run, started
+    with the event {"continuation": token}, skips completed units and ends with the same
+    results. Without a Lambda context the deadline never applies.
+    """
+
+    def __init__(self, name, event=None, context=None, margin_ms=DEADLINE_MARGIN_MS):
+        self.context = context
+        self.margin_ms = margin_ms
+        token = event.get(CONTINUATION_KEY) if isinstance(event, dict) else None
+        self.run_id = token or f"{name}-{uuid.uuid4().hex[:12]}"
+        self.store = open_store(f"{CHECKPOINT_LOCATION.rstrip('/')}/{self.run_id}.json")
+        self.completed = {}
+        self.checkpointed = False
+        if token:
+            data, _ = self.store.read()
+            if data is None:
+                raise ValueError(f"Checkpoint not found for continuation {token}: {self.store!r}")
+            self.completed = json.loads(data)["completed"]
+            self.checkpointed = True
+            print(f"Resuming run {self.run_id}: {len(self.completed)} units already done.")
+
+    def has_time(self):
+        """Return whether there is time to start another unit before the deadline."""
+        remaining = getattr(self.context, "get_remaining_time_in_millis", None)
+        return remaining is None or remaining() > self.margin_ms
+
+    def pending(self, units):
+        """Return the units not completed by an earlier invocation of this run."""
+        return [unit for unit in units if json.dumps(unit) not in self.completed]
+
+    def run(self, units, work, max_workers=10, encode=None, decode=None):
+        """Run work(unit) for every pending unit, at most max_workers at once.
+
+        Returns the decoded results in unit order, or None when the deadline stopped the
+        run; the checkpoint is then saved and suspend() gives the continuation. encode
+        turns a result into JSON-serializable data and decode turns it back.
+        """
+        encode = encode or (lambda result: result)
+        decode = decode or (lambda data: data)
+        units = list(units)
+        queue = iter(self.pending(units))
+        stopped = False
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            in_flight = {}
+            try:
+                while True:
+                    # Start units while there is time, keeping at most max_workers in flight
+                    while not stopped and len(in_flight) < max_workers:
+                        unit = next(queue, None)
+                        if unit is None:
+                            break
+                        if not self.has_time():
+                            stopped = True
+                            break
+                        in_flight[pool.submit(work, unit)] = json.dumps(unit)
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key = in_flight.pop(future)
+                        self.completed[key] = encode(future.result())
+            except BaseException:
+                # Keep what finished, so a retry with the continuation token does not redo it
+                for future in in_flight:
+                    future.cancel()
+                self.save()
+                raise
+
+        if stopped:
+            self.save()
+            return None
+        results = [decode(self.completed[json.dumps(unit)]) for unit in units]
+        if self.checkpointed:
+            self.store.delete()
+        return results
+
+    def save(self):
+        """Write the completed units to the checkpoint store."""
+        self.store.write(json.dumps({"completed": self.completed}, separators=(",", ":"), default=str).encode())
+        self.checkpointed = True
+        print(f"Checkpoint saved to {self.store!r}: {len(self.completed)} units done.")
+
+    def suspend(self):
+        """Return the continuation token, re-invoking this function with it when CONTINUATION_MODE is "invoke"."""
+        continuation = {CONTINUATION_KEY: self.run_id}
+        function_arn = getattr(self.context, "invoked_function_arn", None)
+        if CONTINUATION_MODE == "invoke" and function_arn and not CHECKPOINT_LOCATION.startswith("s3://"):
+            # The re-invoked continuation usually runs in another execution environment, without this /tmp
+            print(f"Warning: CHECKPOINT_LOCATION {CHECKPOINT_LOCATION} is not on S3; not re-invoking the function.")
+            function_arn = None
+        if CONTINUATION_MODE == "invoke" and function_arn:
+            get_client("lambda").invoke(FunctionName=function_arn, InvocationType="Event", Payload=json.dumps(continuation))
+            print(f"Deadline near: continuing run {self.run_id} in a new invocation.")
+        else:
+            print(f"Deadline near: resume with the event {json.dumps(continuation)}.")
+        return continuation
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from aws_common.clients import get_client
+from aws_common.store import open_store
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))  # More than 1 turns a handler into a coordinator of that many shards
+# Directory or "s3://bucket/prefix" for the shards' partial results (S3 when shards run as Lambda invocations)
+SHARD_LOCATION = os.getenv("SHARD_LOCATION", os.path.join(tempfile.gettempdir(), "shards"))
+# "local" runs shards in a process pool, "invoke" as asynchronous Lambda invocations;
+# by default "invoke" inside Lambda (which has no multiprocessing support) and "local" elsewhere
+SHARD_MODE = os.getenv("SHARD_MODE", "")
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 2)))  # Processes in the local pool
+SHARD_TIMEOUT_SECONDS = int(os.getenv("SHARD_TIMEOUT_SECONDS", "780"))  # How long the coordinator waits for invoked shards
+SHARD_POLL_SECONDS = 5
+SHARD_EVENT_KEY = "shard"  # Event key carrying the shard a worker invocation runs
+
+
+def plan_shards(name, keys, count, field):
+    """Split keys (regions, accounts, event ARNs) round-robin into at most count shards.
+
+    Each shard is a JSON-serializable dict with the run ID, its index and the keys
+    under field, so it can be sent to a process or a Lambda invocation as is.
+    """
+    keys = sorted(set(keys))
+    count = max(1, min(count, len(keys)))
+    run_id = f"{name}-{uuid.uuid4().hex[:12]}"
+    if not keys:
+        return []
+    return [{"run_id": run_id, "index": index, "count": count, field: keys[index::count]} for index in range(count)]
+
+
+def shard_from_event(event):
+    """Return the shard a worker invocation should run, or None for a normal invocation."""
+    return event.get(SHARD_EVENT_KEY) if isinstance(event, dict) else None
+
+
+def _shard_store(shard):
+    location = SHARD_LOCATION.rstrip("/")
+    return open_store(f"{location}/{shard['run_id']}/shard-{shard['index']:04d}-of-{shard['count']:04d}.json")
+
+
+def run_shard(worker, shard):
+    """Run worker(shard) and write what it returns as the shard's partial result.
+
+    worker returns a list of rows, or a dict with the rows under "rows" and any other
+    JSON-serializable data the coordinator merges (see merge_shard_results).
+    """
+    result = worker(shard)
+    if not isinstance(result, dict):
+        result = {"rows": result}
+    _shard_store(shard).write(json.dumps(result, separators=(",", ":"), default=str).encode())
+    print(f"Shard {shard['index'] + 1}/{shard['count']} of {shard['run_id']}: {len(result['rows'])} rows.")
+    return len(result["rows"])
+
+
+def _wait_for_shards(shards, context=None):
+    """Poll the shard store until every shard has written its result."""
+    deadline = time.monotonic() + SHARD_TIMEOUT_SECONDS
+    pending = list(shards)
+    while pending:
+        pending = [shard for shard in pending if _shard_store(shard).stamp() is None]
+        if not pending:
+            return
+        remaining = getattr(context, "get_remaining_time_in_millis", None)
+        if time.monotonic() > deadline or (remaining is not None and remaining() < SHARD_POLL_SECONDS * 2000):
+            raise TimeoutError(f"{len(pending)} of {len(shards)} shards of {shards[0]['run_id']} did not finish")
+        time.sleep(SHARD_POLL_SECONDS)
+
+
+def dispatch_shards(worker, shards, context=None, initializer=None, initargs=()):
+    """Run run_shard(worker, shard) for every shard and return once all results are written.
+
+    Locally the shards run in a process pool (initializer, if given, runs first in each
+    process); in Lambda each shard is an asynchronous invocation of the same function
+    with the event {"shard": shard}, and the coordinator waits for their results.
+    """
+    if not shards:
+        return
+    mode = SHARD_MODE or ("invoke" if getattr(context, "invoked_function_arn", None) else "local")
+    if mode == "invoke":
+        if not SHARD_LOCATION.startswith("s3://"):
+            raise ValueError("SHARD_LOCATION must be an s3:// prefix when shards run as Lambda invocations")
+        client = get_client("lambda")
+        for shard in shards:
+            client.invoke(FunctionName=context.invoked_function_arn, InvocationType="Event",
+                          Payload=json.dumps({SHARD_EVENT_KEY: shard}))
+        print(f"Invoked {len(shards)} shards of {shards[0]['run_id']}.")
+        _wait_for_shards(shards, context)
+        return
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    # spawn, not fork: the coordinator's threads and boto3 clients must not be copied into the workers
+    with ProcessPoolExecutor(max_workers=max(1, min(SHARD_WORKERS, len(shards))),
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=initializer, initargs=initargs) as pool:
+        list(pool.map(partial(run_shard, worker), shards))
+
+
+def merge_shard_results(shards, key, on_result=None):
+    """Read every shard's rows, drop duplicates (by key(row)) and return them sorted by key.
+
+    on_result(result), if given, also receives each shard's whole result, for data other
+    than the rows. The partial results are deleted once merged.
+    """
+    rows = {}
+    for shard in shards:
+        store = _shard_store(shard)
+        data, _ = store.read()
+        if data is None:
+            raise RuntimeError(f"Shard {shard['index']} of {shard['run_id']} has no result in {store!r}")
+        result = json.loads(data)
+        if on_result is not None:
+            on_result(result)
+        for row in result["rows"]:
+            rows[key(row)] = row
+    for shard in shards:
+        _shard_store(shard).delete()
+    return [rows[row_key] for row_key in sorted(rows)]
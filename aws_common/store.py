@@ -0,0 +1,92 @@
+import os
+
+from aws_common.clients import get_client
+
+
+class LocalFileStore:
+    """A blob stored in a local file, versioned by its modification time."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def stamp(self):
+        """Return the current version of the file, or None if it does not exist."""
+        try:
+            return str(os.stat(self.path).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def read(self):
+        """Return (data, stamp), or (None, None) if the file does not exist."""
+        try:
+            with open(self.path, "rb") as f:
+                stamp = str(os.fstat(f.fileno()).st_mtime_ns)
+                return f.read(), stamp
+        except FileNotFoundError:
+            return None, None
+
+    def write(self, data):
+        """Replace the file contents atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        """Remove the file, if it exists."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self):
+        return self.path
+
+
+class S3ObjectStore:
+    """A blob stored in an S3 object, versioned by its ETag."""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+
+    def stamp(self):
+        """Return the object's ETag, or None if it does not exist."""
+        client = get_client("s3")
+        try:
+            return client.head_object(Bucket=self.bucket, Key=self.key)["ETag"]
+        except client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def read(self):
+        """Return (data, ETag), or (None, None) if the object does not exist."""
+        client = get_client("s3")
+        try:
+            response = client.get_object(Bucket=self.bucket, Key=self.key)
+        except client.exceptions.NoSuchKey:
+            return None, None
+        return response["Body"].read(), response["ETag"]
+
+    def write(self, data):
+        """Replace the object contents."""
+        get_client("s3").put_object(Bucket=self.bucket, Key=self.key, Body=data)
+
+    def delete(self):
+        """Remove the object (a no-op if it does not exist)."""
+        get_client("s3").delete_object(Bucket=self.bucket, Key=self.key)
+
+    def __repr__(self):
+        return f"s3://{self.bucket}/{self.key}"
+
+
+def open_store(location):
+    """Return a store for an "s3://bucket/key" URL or a local file path."""
+    if location.startswith("s3://"):
+        bucket, _, key = location[len("s3://"):].partition("/")
+        return S3ObjectStore(bucket, key)
+    return LocalFileStore(location)
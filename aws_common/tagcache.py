@@ -0,0 +1,138 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+TAG_CACHE_TTL_SECONDS = float(os.getenv("TAG_CACHE_TTL_SECONDS", "86400"))  # How long cached tags stay valid
+TAG_CACHE_MAX_ENTRIES = int(os.getenv("TAG_CACHE_MAX_ENTRIES", "50000"))  # In-memory entries before LRU eviction
+TAG_CACHE_PATH = os.getenv("TAG_CACHE_PATH", "")  # SQLite file for the persistent tier ("" disables it)
+
+
+class SQLiteTagBackend:
+    """Persistent tag cache tier in a local SQLite file.
+
+    Any object with the same get_many/put_many methods (for example one backed by
+    DynamoDB) can be passed to TagCache instead.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS tags (arn TEXT PRIMARY KEY, tags TEXT, stored_at REAL)")
+
+    def get_many(self, arns):
+        """Return {arn: (tags, stored_at)} for the ARNs present in the file."""
+        found = {}
+        arns = list(arns)
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(arns), 500):
+                batch = arns[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT arn, tags, stored_at FROM tags WHERE arn IN ({','.join('?' * len(batch))})", batch
+                )
+                for arn, tags, stored_at in rows:
+                    found[arn] = (json.loads(tags), stored_at)
+        return found
+
+    def put_many(self, items):
+        """Store {arn: (tags, stored_at)}."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tags (arn, tags, stored_at) VALUES (?, ?, ?)",
+                [(arn, json.dumps(tags), stored_at) for arn, (tags, stored_at) in items.items()],
+            )
+
+
+class TagCache:
+    """Resource tags keyed by ARN, with a TTL, LRU eviction and an optional persistent tier."""
+
+    def __init__(self, ttl_seconds=TAG_CACHE_TTL_SECONDS, max_entries=TAG_CACHE_MAX_ENTRIES, backend=None):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, arns):
+        """Return {arn: tags} for the ARNs with fresh cached tags; the rest count as misses."""
+        now = time.time()
+        arns = list(dict.fromkeys(arns))
+        found = {}
+        missing = []
+        with self._lock:
+            for arn in arns:
+                entry = self._entries.get(arn)
+                if entry and now - entry[1] < self.ttl:
+                    self._entries.move_to_end(arn)
+                    found[arn] = entry[0]
+                else:
+                    missing.append(arn)
+
+        if missing and self.backend is not None:
+            stored = {arn: entry for arn, entry in self.backend.get_many(missing).items() if now - entry[1] < self.ttl}
+            with self._lock:
+                for arn, entry in stored.items():
+                    self._remember(arn, entry)
+                    found[arn] = entry[0]
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(arns) - len(found)
+        return found
+
+    def get(self, arn):
+        """Return the cached tags for an ARN, or None."""
+        return self.get_many([arn]).get(arn)
+
+    def put_many(self, tags_by_arn):
+        """Cache {arn: tags}."""
+        if not tags_by_arn:
+            return
+        now = time.time()
+        items = {arn: (tags, now) for arn, tags in tags_by_arn.items()}
+        with self._lock:
+            for arn, entry in items.items():
+                self._remember(arn, entry)
+        if self.backend is not None:
+            self.backend.put_many(items)
+
+    def put(self, arn, tags):
+        """Cache the tags of one ARN."""
+        self.put_many({arn: tags})
+
+    def _remember(self, arn, entry):
+        self._entries[arn] = entry
+        self._entries.move_to_end(arn)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def reset_stats(self):
+        """Start counting hits and misses for a new run."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def report(self):
+        """Print the hit/miss ratio of the current run."""
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        print(f"Tag cache: {self.hits} hits, {self.misses} misses ({ratio:.0%} hit ratio).")
+
+
+_tag_cache = None
+_tag_cache_lock = threading.Lock()
+
+
+def get_tag_cache():
+    """Return the process-wide tag cache, which is kept across warm Lambda invocations."""
+    global _tag_cache
+    with _tag_cache_lock:
+        if _tag_cache is None:
+            _tag_cache = TagCache(backend=SQLiteTagBackend(TAG_CACHE_PATH) if TAG_CACHE_PATH else None)
+    return _tag_cache
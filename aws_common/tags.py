@@ -0,0 +1,53 @@
+from aws_common.clients import get_client
+from aws_common.tagcache import get_tag_cache
+
+TAGGING_BATCH_SIZE = 100  # Max ARNs per Resource Groups Tagging API get_resources call
+
+
+def _tag_dict(tags):
+    return {tag["Key"]: tag["Value"] for tag in tags}
+
+
+def get_rds_tags(region, arns, account_id=None):
+    """Return ({arn: tags}, api_calls) for RDS resource ARNs in one region.
+
+    Tags come from the shared tag cache, then from batched Resource Groups Tagging API
+    lookups (100 ARNs per request). Any ARN the bulk lookup does not return (it leaves out
+    untagged resources, and a batch can fail) is looked up with list_tags_for_resource.
+    ARNs whose tags cannot be read are left out of the result and are not cached.
+    """
+    tag_cache = get_tag_cache()
+    arns = list(dict.fromkeys(arns))
+    tags_by_arn = tag_cache.get_many(arns)
+    missing = [arn for arn in arns if arn not in tags_by_arn]
+    fetched = {}
+    api_calls = 0
+
+    if missing:
+        client = get_client("resourcegroupstaggingapi", region, account_id)
+        paginator = client.get_paginator("get_resources")
+        for start in range(0, len(missing), TAGGING_BATCH_SIZE):
+            batch = missing[start:start + TAGGING_BATCH_SIZE]
+            try:
+                for page in paginator.paginate(ResourceARNList=batch):
+                    api_calls += 1
+                    for mapping in page.get("ResourceTagMappingList", []):
+                        fetched[mapping["ResourceARN"]] = _tag_dict(mapping.get("Tags", []))
+            except client.exceptions.ClientError as e:
+                print(f"Error fetching tags in bulk in {region}: {e}")
+
+    # Fall back to one call per resource for anything the bulk lookup did not return
+    remaining = [arn for arn in missing if arn not in fetched]
+    if remaining:
+        rds_client = get_client("rds", region, account_id)
+        for arn in remaining:
+            try:
+                response = rds_client.list_tags_for_resource(ResourceName=arn)
+                api_calls += 1
+                fetched[arn] = _tag_dict(response.get("TagList", []))
+            except rds_client.exceptions.ClientError as e:
+                print(f"Error fetching tags for {arn}: {e}")
+
+    tag_cache.put_many(fetched)
+    tags_by_arn.update(fetched)
+    return tags_by_arn, api_calls
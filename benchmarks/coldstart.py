@@ -0,0 +1,112 @@
+"""Cold-start benchmark for every Lambda entry point.
+
+Each sample runs in a fresh interpreter. Import time is measured in a clean
+interpreter; the first invocation is measured against an empty, offline
+account (moto, plus canned AWS Health responses), so it covers client
+creation and handler set-up rather than AWS latency.
+
+    python benchmarks/coldstart.py --repeat 5 --output coldstart.json
+    python benchmarks/coldstart.py --baseline coldstart.json   # exits 1 on regression
+
+Requires moto (pip install moto).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from offline import ENTRY_POINTS
+
+IMPORT_SAMPLE = r"""
+import json, sys, time
+sys.path.insert(0, {benchmarks!r})
+start = time.perf_counter()
+from offline import import_entry_point
+import_entry_point({name!r})
+print(json.dumps({{"import_ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+INVOCATION_SAMPLE = r"""
+import contextlib, io, json, sys, time
+sys.path.insert(0, {benchmarks!r})
+from offline import import_entry_point, offline_aws, set_offline_environment
+set_offline_environment({tmp_dir!r})
+module = import_entry_point({name!r})
+with offline_aws(), contextlib.redirect_stdout(io.StringIO()):
+    start = time.perf_counter()
+    getattr(module, {handler!r})({{}}, None)
+    elapsed = time.perf_counter() - start
+print(json.dumps({{"first_invocation_ms": elapsed * 1000}}))
+"""
+
+
+def run_sample(template, **fields):
+    """Run one sample in a fresh interpreter and return its JSON result."""
+    benchmarks = os.path.dirname(os.path.abspath(__file__))
+    code = template.format(benchmarks=benchmarks, **fields)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark(names, repeat):
+    results = {}
+    for name in names:
+        _, handler = ENTRY_POINTS[name]
+        imports = []
+        invocations = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                imports.append(run_sample(IMPORT_SAMPLE, name=name)["import_ms"])
+                invocations.append(
+                    run_sample(INVOCATION_SAMPLE, name=name, handler=handler, tmp_dir=tmp_dir)["first_invocation_ms"]
+                )
+        results[name] = {
+            "import_ms": round(statistics.median(imports), 2),
+            "first_invocation_ms": round(statistics.median(invocations), 2),
+        }
+        print(f"{name}: import {results[name]['import_ms']} ms, "
+              f"first invocation {results[name]['first_invocation_ms']} ms", file=sys.stderr)
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    """Return messages for metrics that are more than tolerance slower than the baseline."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if previous and value > previous * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {value} ms vs {previous} ms baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("entry_points", nargs="*", default=list(ENTRY_POINTS), help="entry points to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per entry point (median is reported)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = {"benchmark": "coldstart", "python": sys.version.split()[0], "results": benchmark(args.entry_points, args.repeat)}
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results["results"], json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+"""Synthetic-fleet benchmark for every scanner.
+
+Every AWS call is answered locally from a generated fleet (RDS instances, Lambda
+functions, AWS Health events with their affected accounts and entities), after an
+optional injected latency, so the scanners can be measured at scale with no account.
+Each scenario runs in a fresh interpreter and reports wall time, API calls per
+operation and peak memory as JSON, so runs from two commits can be compared.
+
+    python benchmarks/fleet.py --output fleet.json
+    python benchmarks/fleet.py --scenario rds --rds-instances 10000 --latency-ms 50
+
+Scenarios:
+    rds           rds_eol_checker: get_rds_instances() and the report
+    lambda        check_lambda_runtime: every region's get_lambda_functions() and the report
+    health        healthEvents: get_upcoming_events() and format_html_message()
+    health_org    healthEventsOrgLevel: get_organization_events() and format_html_message()
+    rds_org       rds_eol_checker with ORG_ACCOUNTS=all, the fleet split across --org-accounts accounts
+    lambda_org    check_lambda_runtime with ORG_ACCOUNTS=all, likewise
+    rds_sharded, lambda_sharded, health_org_sharded
+                  the coordinator modes, with --shards shards in a local process pool
+    health_incremental, health_org_incremental
+                  health and health_org on the day after a first run, with --changed-events
+                  events updated; only that second run is measured
+
+Only needs boto3; nothing is sent to AWS.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from offline import import_entry_point, set_offline_environment
+
+SCENARIOS = (
+    "rds", "lambda", "health", "health_org", "rds_org", "lambda_org",
+    "rds_sharded", "lambda_sharded", "health_org_sharded",
+    "health_incremental", "health_org_incremental",
+)
+
+ALL_REGIONS = [
+    "us-east-1", "us-east-2", "us-west-1", "us-west-2", "ca-central-1", "sa-east-1",
+    "eu-west-1", "eu-west-2", "eu-west-3", "eu-central-1", "eu-north-1", "eu-south-1",
+    "ap-southeast-1", "ap-southeast-2", "ap-southeast-3", "ap-northeast-1", "ap-northeast-2",
+    "ap-northeast-3", "ap-south-1", "ap-east-1", "me-south-1", "af-south-1",
+]
+
+ACCOUNT_ID = "123456789012"
+
+# A mix of catalogued, nearest-match and unknown versions
+RDS_ENGINES = [
+    ("mysql", "8.0.35"), ("mysql", "8.0.40"), ("mysql", "8.4.3"), ("postgres", "16.7"),
+    ("postgres", "13.11"), ("postgres", "17.2"), ("aurora-mysql", "8.0.mysql_aurora.3.05.2"),
+    ("mariadb", "10.6.14"),
+]
+
+# Mostly supported runtimes, as in a real account
+LAMBDA_RUNTIMES = [
+    "python3.12", "python3.11", "nodejs20.x", "nodejs18.x", "java17", "python3.13",
+    "python3.8", "nodejs16.x", "python3.9", "java8",
+]
+
+HEALTH_EVENT_TYPES = [
+    ("EC2", "AWS_EC2_INSTANCE_SCHEDULED_MAINTENANCE"),
+    ("RDS", "AWS_RDS_MAINTENANCE_SCHEDULED"),
+    ("LAMBDA", "AWS_LAMBDA_RUNTIME_DEPRECATION"),
+    ("EKS", "AWS_EKS_PLANNED_LIFECYCLE_EVENT"),
+]
+
+DEFAULT_FLEET = {
+    "regions": 20,
+    "rds_instances": 10000,
+    "lambda_functions": 50000,
+    "health_events": 2000,
+    "entities_per_event": 100,
+    "org_accounts": 10,
+    "changed_events": 20,
+}
+
+# (initializer, initargs) that make shard processes answer from the same synthetic fleet
+SHARD_WORKER_SETUP = (None, ())
+_worker_stack = None
+
+
+def _page(items, token, size, prefix="tok-"):
+    """Return (items of the page starting at token, next token or None)."""
+    start = int(token[len(prefix):]) if token else 0
+    end = start + size
+    return items[start:end], (f"{prefix}{end}" if end < len(items) else None)
+
+
+class SyntheticFleet:
+    """Answers AWS API calls from a fleet generated on demand from its sizes."""
+
+    def __init__(self, regions, rds_instances, lambda_functions, health_events, entities_per_event, org_accounts,
+                 changed_events=0):
+        self.regions = ALL_REGIONS[:regions]
+        self.rds_instances = rds_instances
+        self.lambda_functions = lambda_functions
+        self.health_events = health_events
+        self.entities_per_event = entities_per_event
+        self.accounts = [str(100000000000 + n) for n in range(org_accounts)]
+        self.changed_events = changed_events
+        self.generation = 0
+
+    def advance(self):
+        """Move to the next day, on which the first changed_events events have been updated."""
+        self.generation += 1
+
+    def _region_share(self, total, region):
+        """Indices of the resources placed in a region (spread round-robin)."""
+        offset = self.regions.index(region)
+        return range(offset, total, len(self.regions))
+
+    def _db_arn(self, region, index, account_id=ACCOUNT_ID):
+        return f"arn:aws:rds:{region}:{account_id}:db:db-{index:06d}"
+
+    def _db_instance(self, region, index, account_id=ACCOUNT_ID):
+        engine, version = RDS_ENGINES[index % len(RDS_ENGINES)]
+        instance = {
+            "DBInstanceIdentifier": f"db-{index:06d}",
+            "DBInstanceArn": self._db_arn(region, index, account_id),
+            "Engine": engine,
+            "EngineVersion": version,
+        }
+        # Every fourth instance comes back without a TagList, so tags are looked up in bulk
+        if index % 4:
+            instance["TagList"] = [{"Key": "contact", "Value": f"team{index % 50}@example.com"}]
+        return instance
+
+    def _function(self, region, index, account_id=ACCOUNT_ID):
+        return {
+            "FunctionName": f"function-{index:06d}",
+            "FunctionArn": f"arn:aws:lambda:{region}:{account_id}:function:function-{index:06d}",
+            "Runtime": LAMBDA_RUNTIMES[index % len(LAMBDA_RUNTIMES)],
+            "LastModified": "2025-01-01T00:00:00.000+0000",
+            "RevisionId": f"rev-{index}",
+        }
+
+    def _event_arn(self, index):
+        service, code = HEALTH_EVENT_TYPES[index % len(HEALTH_EVENT_TYPES)]
+        return f"arn:aws:health:us-east-1::event/{service}/{code}/{code}_{index:06d}"
+
+    def _event(self, index):
+        service, code = HEALTH_EVENT_TYPES[index % len(HEALTH_EVENT_TYPES)]
+        updated_day = 1 + (self.generation if index < self.changed_events else 0)
+        return {
+            "arn": self._event_arn(index),
+            "service": service,
+            "eventTypeCode": code,
+            "region": self.regions[index % len(self.regions)],
+            "startTime": "2026-01-01 00:00:00+00:00",
+            "lastUpdatedTime": f"2025-12-{updated_day:02d} 00:00:00+00:00",
+            "statusCode": "upcoming",
+        }
+
+    def _event_index(self, arn):
+        return int(arn.rsplit("_", 1)[1])
+
+    def _entities(self, arn, account_id=None, count=None):
+        count = self.entities_per_event if count is None else count
+        entity = {"eventArn": arn}
+        if account_id is not None:
+            entity["awsAccountId"] = account_id
+        return [dict(entity, entityValue=f"i-{self._event_index(arn):06d}{n:05d}") for n in range(count)]
+
+    def respond(self, service, operation, region, params, account_id=ACCOUNT_ID):
+        """Return the parsed response for one API call made with account_id's credentials."""
+        if operation == "GetCallerIdentity":
+            return {"Account": ACCOUNT_ID, "Arn": f"arn:aws:iam::{ACCOUNT_ID}:role/scanner", "UserId": "synthetic"}
+        if operation == "AssumeRole":
+            import datetime
+
+            # The access key carries the account, so later calls know whose resources to return
+            return {"Credentials": {
+                "AccessKeyId": f"ASIA{params['RoleArn'].split(':')[4]}",
+                "SecretAccessKey": "synthetic",
+                "SessionToken": "synthetic",
+                "Expiration": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1),
+            }}
+        if operation == "ListAccounts":
+            return {"Accounts": [{"Id": account, "Status": "ACTIVE"} for account in self.accounts]}
+
+        if operation == "DescribeRegions":
+            return {"Regions": [{"RegionName": name} for name in self.regions]}
+
+        if operation == "DescribeDBInstances":
+            indices, marker = _page(self._region_share(self.rds_instances, region), params.get("Marker"),
+                                    params.get("MaxRecords", 100))
+            response = {"DBInstances": [self._db_instance(region, index, account_id) for index in indices]}
+            if marker:
+                response["Marker"] = marker
+            return response
+
+        if operation == "GetResources":
+            return {"ResourceTagMappingList": [
+                {"ResourceARN": arn, "Tags": [{"Key": "contact", "Value": "bulk@example.com"}]}
+                for arn in params.get("ResourceARNList", [])
+            ]}
+
+        if operation == "ListTagsForResource":
+            return {"TagList": [{"Key": "contact", "Value": "fallback@example.com"}]}
+
+        if operation == "ListFunctions":
+            indices, marker = _page(self._region_share(self.lambda_functions, region), params.get("Marker"),
+                                    params.get("MaxItems", 50))
+            response = {"Functions": [self._function(region, index, account_id) for index in indices]}
+            if marker:
+                response["NextMarker"] = marker
+            return response
+
+        if operation == "ListTags":
+            index = int(params["Resource"].rsplit("-", 1)[1])
+            return {"Tags": {"contact": f"team{index % 50}@example.com", "team": f"team{index % 50}"}}
+
+        if operation in ("DescribeEvents", "DescribeEventsForOrganization"):
+            import datetime
+
+            events = [self._event(index) for index in range(self.health_events)]
+            updated = params["filter"].get("lastUpdatedTime") or (params["filter"].get("lastUpdatedTimes") or [None])[0]
+            if updated:
+                since = datetime.datetime.fromisoformat(str(updated["from"]))
+                events = [event for event in events
+                          if datetime.datetime.fromisoformat(event["lastUpdatedTime"]) >= since]
+            # Returned as one page
+            return {"events": events}
+
+        if operation == "DescribeEventDetails":
+            return {"successfulSet": [
+                {"event": {"arn": arn},
+                 "eventDescription": {"latestDescription": f"Scheduled maintenance for {arn}. " * 4}}
+                for arn in params["eventArns"]
+            ], "failedSet": []}
+
+        if operation == "DescribeAffectedEntities":
+            entities = [entity for arn in params["filter"]["eventArns"] for entity in self._entities(arn)]
+            page, token = _page(entities, params.get("nextToken"), params.get("maxResults", 100))
+            return dict({"entities": page}, **({"nextToken": token} if token else {}))
+
+        if operation == "DescribeAffectedAccountsForOrganization":
+            page, token = _page(self.accounts, params.get("nextToken"), params.get("maxResults", 100))
+            return dict({"affectedAccounts": page}, **({"nextToken": token} if token else {}))
+
+        if operation == "DescribeAffectedEntitiesForOrganization":
+            # An event's entities are split across the accounts it affects
+            per_account = max(1, self.entities_per_event // max(1, len(self.accounts)))
+            entities = [entity for item in params["organizationEntityFilters"]
+                        for entity in self._entities(item["eventArn"], item["awsAccountId"], per_account)]
+            page, token = _page(entities, params.get("nextToken"), params.get("maxResults", 100))
+            return dict({"entities": page}, **({"nextToken": token} if token else {}))
+
+        if operation in ("SendEmail", "SendRawEmail"):
+            return {"MessageId": "synthetic"}
+        if operation == "GetSendQuota":
+            return {"Max24HourSend": 50000.0, "MaxSendRate": 14.0, "SentLast24Hours": 0.0}
+
+        raise NotImplementedError(f"{service}.{operation} is not part of the synthetic fleet")
+
+
+@contextlib.contextmanager
+def synthetic_aws(fleet, latency_ms=0):
+    """Answer every call from the shared client pool from fleet, and count calls per operation."""
+    import boto3
+    from botocore.awsrequest import AWSResponse
+
+    import aws_common.clients
+
+    calls = Counter()
+    lock = threading.Lock()
+    latency = latency_ms / 1000.0
+
+    def keep_params(params, context, **kwargs):
+        context["synthetic_params"] = params
+
+    def answer(model, context, request_signer, **kwargs):
+        service = model.service_model.service_name
+        with lock:
+            calls[f"{service}.{model.name}"] += 1
+        if latency:
+            time.sleep(latency)
+        access_key = request_signer._credentials.access_key
+        account_id = access_key[4:] if access_key.startswith("ASIA") else ACCOUNT_ID
+        response = fleet.respond(service, model.name, context["client_region"], context["synthetic_params"], account_id)
+        return AWSResponse(f"https://{service}.amazonaws.com", 200, {}, None), response
+
+    session = boto3.session.Session()
+    session.events.register("before-parameter-build", keep_params)
+    session.events.register("before-call", answer)
+    aws_common.clients._session = session
+    aws_common.clients._clients.clear()
+    try:
+        yield calls
+    finally:
+        aws_common.clients._session = None
+        aws_common.clients._clients.clear()
+
+
+def install_synthetic(fleet, latency_ms, counts_dir):
+    """Shard process initializer: answer this process's calls from fleet and write its call counts on exit."""
+    import atexit
+
+    global _worker_stack
+
+    sys.stdout = open(os.devnull, "w")
+    # Kept in a global: a collected stack would close the synthetic_aws generator and undo it
+    _worker_stack = contextlib.ExitStack()
+    calls = _worker_stack.enter_context(synthetic_aws(fleet, latency_ms))
+
+    def write_counts():
+        with open(os.path.join(counts_dir, f"{os.getpid()}.json"), "w") as f:
+            json.dump(dict(calls), f)
+    atexit.register(write_counts)
+
+
+def run_rds():
+    module = import_entry_point("rds_eol_checker")
+    module.load_eos_index()
+    table = module.create_rds_table(module.get_rds_instances())
+    return len(table), len(module.render_rds_report(table))
+
+
+def run_lambda():
+    from aws_common.regions import scan_regions
+
+    module = import_entry_point("check_lambda_runtime")
+    deprecated, soon_deprecated = [], []
+    for region_deprecated, region_soon in scan_regions(module.scan_region, module.get_regions(), module.MAX_WORKERS):
+        deprecated.extend(region_deprecated)
+        soon_deprecated.extend(region_soon)
+    return len(deprecated) + len(soon_deprecated), len(module.generate_html_report(deprecated, soon_deprecated))
+
+
+def run_health():
+    module = import_entry_point("healthEvents")
+    events = module.get_upcoming_events()
+    body_html, _ = module.format_html_message(events)
+    return len(events), len(body_html)
+
+
+def run_health_org():
+    module = import_entry_point("healthEventsOrgLevel")
+    events = module.get_organization_events()
+    return len(events), len(module.format_html_message(events))
+
+
+def run_lambda_org():
+    from aws_common.accounts import scan_accounts
+
+    module = import_entry_point("check_lambda_runtime")
+    results = scan_accounts(lambda account_id, region: module.scan_region(region, None, account_id),
+                            module.get_scan_accounts())
+    rows = [row for _, (deprecated, soon_deprecated) in results for row in deprecated + soon_deprecated]
+    return len(rows), len(module.generate_html_report(rows, []))
+
+
+def run_rds_sharded():
+    module = import_entry_point("rds_eol_checker")
+    module.load_eos_index()
+    table = module.create_rds_table(module.get_rds_instances_sharded(None, *SHARD_WORKER_SETUP))
+    return len(table), len(module.render_rds_report(table))
+
+
+def run_lambda_sharded():
+    module = import_entry_point("check_lambda_runtime")
+    deprecated, soon_deprecated = module.get_lambda_functions_sharded(None, *SHARD_WORKER_SETUP)
+    return len(deprecated) + len(soon_deprecated), len(module.generate_html_report(deprecated, soon_deprecated))
+
+
+def run_health_org_sharded():
+    module = import_entry_point("healthEventsOrgLevel")
+    events = module.get_organization_events()
+    collected = module.collect_affected_resources_sharded(events, None, *SHARD_WORKER_SETUP)
+    return len(events), len(module.render_html_message(*collected))
+
+
+RUNNERS = {
+    "rds": run_rds,
+    "lambda": run_lambda,
+    "health": run_health,
+    "health_org": run_health_org,
+    "rds_org": run_rds,
+    "lambda_org": run_lambda_org,
+    "rds_sharded": run_rds_sharded,
+    "lambda_sharded": run_lambda_sharded,
+    "health_org_sharded": run_health_org_sharded,
+    "health_incremental": run_health,
+    "health_org_incremental": run_health_org,
+}
+
+
+def run_scenario(name, fleet_sizes, latency_ms, trace_memory, shards=1):
+    """Run one scenario in this interpreter and return its measurements."""
+    import resource
+    import tracemalloc
+
+    global SHARD_WORKER_SETUP
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        set_offline_environment(tmp_dir)
+        os.environ["TAG_CACHE_PATH"] = ""
+        fleet = SyntheticFleet(**fleet_sizes)
+        if name.endswith("_org") and name != "health_org":
+            # The same fleet, split evenly across the organization's accounts
+            os.environ["ORG_ACCOUNTS"] = "all"
+            accounts = max(1, len(fleet.accounts))
+            fleet.rds_instances //= accounts
+            fleet.lambda_functions //= accounts
+        counts_dir = os.path.join(tmp_dir, "shard_calls")
+        if name.endswith("_sharded"):
+            os.makedirs(counts_dir)
+            os.environ.update(SHARD_COUNT=str(shards), SHARD_MODE="local", SHARD_LOCATION=os.path.join(tmp_dir, "shards"))
+            SHARD_WORKER_SETUP = (install_synthetic, (fleet, latency_ms, counts_dir))
+        with synthetic_aws(fleet, latency_ms) as calls, contextlib.redirect_stdout(io.StringIO()):
+            if name.endswith("_incremental"):
+                # A first run fills the event state; the run after some events changed is measured
+                RUNNERS[name]()
+                fleet.advance()
+                calls.clear()
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            rows, report_bytes = RUNNERS[name]()
+            elapsed = time.perf_counter() - start
+            traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+            tracemalloc.stop()
+        # Calls made by shard processes
+        if os.path.isdir(counts_dir):
+            for counts_file in os.listdir(counts_dir):
+                with open(os.path.join(counts_dir, counts_file)) as f:
+                    calls.update(json.load(f))
+
+    # ru_maxrss is in kilobytes on Linux; shard processes count as children
+    peak_rss_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    result = {
+        "wall_seconds": round(elapsed, 3),
+        "api_calls": sum(calls.values()),
+        "api_calls_by_operation": dict(sorted(calls.items())),
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+        "report_rows": rows,
+        "report_bytes": report_bytes,
+    }
+    if traced_peak is not None:
+        result["peak_traced_mb"] = round(traced_peak / (1024 * 1024), 1)
+    return result
+
+
+def run_in_subprocess(name, fleet_sizes, latency_ms, trace_memory, shards=1):
+    """Run one scenario in a fresh interpreter, so memory and caches start clean."""
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--latency-ms", str(latency_ms),
+               "--shards", str(shards)]
+    for key, value in fleet_sizes.items():
+        command += [f"--{key.replace('_', '-')}", str(value)]
+    if trace_memory:
+        command.append("--trace-memory")
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Scenario to run (default: all)")
+    for key, value in DEFAULT_FLEET.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, default=value)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Latency added to every API call")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report the tracemalloc peak (slower)")
+    parser.add_argument("--shards", type=int, default=4, help="Shards of the *_sharded scenarios")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    fleet_sizes = {key: getattr(args, key) for key in DEFAULT_FLEET}
+    if args.child:
+        print(json.dumps(run_scenario(args.child, fleet_sizes, args.latency_ms, args.trace_memory, args.shards)))
+        return 0
+
+    results = {"fleet": fleet_sizes, "latency_ms": args.latency_ms, "shards": args.shards, "scenarios": {}}
+    for name in args.scenario or SCENARIOS:
+        result = run_in_subprocess(name, fleet_sizes, args.latency_ms, args.trace_memory, args.shards)
+        results["scenarios"][name] = result
+        print(f"{name:<22} {result['wall_seconds']:>9.2f} s {result['api_calls']:>8} calls "
+              f"{result['peak_rss_mb']:>8.1f} MB peak RSS")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Offline AWS for the benchmarks: moto for most services, canned AWS Health responses."""
+import contextlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Script directory and module name of each entry point
+ENTRY_POINTS = {
+    "rds_eol_checker": ("rds_eol_checker", "lambda_handler"),
+    "check_lambda_runtime": ("check_lambda_runtime", "lambda_handler"),
+    "healthEvents": ("healthEvents", "lambda_handler"),
+    "healthEventsOrgLevel": ("healthEventsOrgLevel", "lambda_handler"),
+    "rds_lifecycle_events": ("rds_lifecycle_events", "lambda_handler"),
+}
+
+# moto does not implement AWS Health, so these operations answer from here
+EMPTY_HEALTH_RESPONSES = {
+    "DescribeEvents": {"events": []},
+    "DescribeEventsForOrganization": {"events": []},
+    "DescribeEventDetails": {"successfulSet": [], "failedSet": []},
+    "DescribeAffectedEntities": {"entities": []},
+    "DescribeAffectedEntitiesForOrganization": {"entities": []},
+    "DescribeAffectedAccountsForOrganization": {"affectedAccounts": []},
+}
+
+
+def import_entry_point(name):
+    """Import an entry point's module the way Lambda does, from its own directory."""
+    import importlib
+
+    directory, _ = ENTRY_POINTS[name]
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    return importlib.import_module(name)
+
+
+def set_offline_environment(tmp_dir):
+    """Point credentials, regions and local state files at harmless values."""
+    os.environ.update(
+        AWS_ACCESS_KEY_ID="testing",
+        AWS_SECRET_ACCESS_KEY="testing",
+        AWS_SESSION_TOKEN="testing",
+        AWS_DEFAULT_REGION="us-east-1",
+        SNAPSHOT_LOCATION=os.path.join(tmp_dir, "lambda_runtime_snapshot.json"),
+        EOL_CATALOG_CACHE=os.path.join(tmp_dir, "rds_eol_catalog.cache.json"),
+        EVENT_STATE_LOCATION=os.path.join(tmp_dir, "event_state"),
+    )
+
+
+@contextlib.contextmanager
+def offline_aws(health_responses=None, before_call=None):
+    """Run the scripts against moto, answering AWS Health calls from health_responses.
+
+    health_responses maps an operation name to a response, or to a callable taking the
+    request parameters. before_call(service, operation) is invoked ahead of every call.
+    """
+    import boto3
+    from botocore.awsrequest import AWSResponse
+    from moto import mock_aws
+
+    import aws_common.clients
+
+    responses = dict(EMPTY_HEALTH_RESPONSES)
+    responses.update(health_responses or {})
+
+    def answer_health(model, params, **kwargs):
+        response = responses[model.name]
+        if callable(response):
+            response = response(params)
+        return AWSResponse("https://health.us-east-1.amazonaws.com", 200, {}, None), response
+
+    def notify(model, **kwargs):
+        before_call(model.service_model.service_name, model.name)
+
+    with mock_aws():
+        session = boto3.session.Session()
+        if before_call is not None:
+            session.events.register("before-call", notify)
+        session.events.register("before-call.health", answer_health)
+        # Clients from the shared pool are built from this session
+        aws_common.clients._session = session
+        aws_common.clients._clients.clear()
+        try:
+            yield session
+        finally:
+            aws_common.clients._session = None
+            aws_common.clients._clients.clear()
@@ -1,56 +1,197 @@
-import boto3
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from botocore.exceptions import NoCredentialsError, ClientError
 
-#session = boto3.Session(profile_name="AdminRole-526424395864")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared aws_common package
+
+from aws_common.accounts import ORG_MAX_WORKERS, get_scan_accounts, list_account_regions, releasing_clients, scan_accounts
+from aws_common.clients import get_client
+from aws_common.delivery import deliver_messages, partition_by_contact
+from aws_common.metrics import emit_metrics
+from aws_common.profiling import profile_handler
+from aws_common.regions import get_regions, scan_regions
+from aws_common.report import HtmlReport
+from aws_common.scheduler import DeadlineScheduler
+from aws_common.shards import SHARD_COUNT, dispatch_shards, merge_shard_results, plan_shards, run_shard, shard_from_event
+from aws_common.store import open_store
+from aws_common.tagcache import get_tag_cache
+
+# Comma-separated regions to scan; all enabled regions are scanned when unset
+REGIONS = [region.strip() for region in os.getenv("REGIONS", "").split(",") if region.strip()]
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))  # Regions scanned in parallel
+TAG_WORKERS = int(os.getenv("TAG_WORKERS", "10"))  # Concurrent list_tags calls per region
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))  # Emails sent in parallel (within the SES send rate)
+# Snapshot of previously resolved functions: a local path or s3://bucket/key ("" disables it)
+SNAPSHOT_LOCATION = os.getenv("SNAPSHOT_LOCATION", os.path.join(tempfile.gettempdir(), "lambda_runtime_snapshot.json"))
+# Tag changes do not touch RevisionId, so cached tags are refreshed after this long
+SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("SNAPSHOT_MAX_AGE_HOURS", "168"))
+
+# Function counters for the current run, shared by the region workers
+TAG_LOOKUP_STATS = {"functions": 0, "flagged": 0}
+_tag_stats_lock = threading.Lock()
 
 # AWS Lambda Supported and Deprecated Runtimes - https://docs.aws.amazon.com/lambda/latest/dg/lambda-runtimes.html
-SUPPORTED_RUNTIMES = [
+SUPPORTED_RUNTIMES = {
     "nodejs22.x", "nodejs20.x", "nodejs18.x",
     "python3.13", "python3.12", "python3.11", "python3.10", "python3.9",
     "java21", "java17", "java11",
     ".NET 8", "ruby3.3", "ruby3.2"
-]
+}
 
-DEPRECATED_RUNTIMES = [
+DEPRECATED_RUNTIMES = {
     ".NET 6", "python3.8", "nodejs16.x", ".NET 7 (container only)", "java8", "go1.x",
     "OS-only Runtime", "ruby2.7", "nodejs14.x", "python3.7", "dotnetcore3.1", "nodejs12.x",
     "python3.6", ".NET 5 (container only)", "dotnetcore2.1", "nodejs10.x", "ruby2.5",
     "python2.7", "nodejs8.10", "nodejs4.3", "nodejs4.3-edge", "nodejs6.10",
     "dotnetcore1.0", "dotnetcore2.0", "nodejs0.10"
-]
+}
 
-SOON_TO_BE_DEPRECATED = [
+SOON_TO_BE_DEPRECATED = {
     "python3.9", "java8"  # Add any runtime set to deprecate in the next 6 months
-]
+}
+
+class FunctionSnapshot:
+    """Resolved tags of each function from the previous run, keyed by function ARN.
+
+    The store can be any object with read() -> (data, stamp) and write(data), such as
+    aws_common.store.LocalFileStore or S3ObjectStore.
+    """
+
+    def __init__(self, store, max_age_hours=SNAPSHOT_MAX_AGE_HOURS):
+        self.store = store
+        self.max_age = max_age_hours * 3600
+        self.previous = {}
+        self.current = {}
+        self.reused = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+
+        data, _ = store.read()
+        if data:
+            try:
+                self.previous = json.loads(data).get("functions", {})
+            except ValueError as e:
+                print(f"Ignoring unreadable snapshot {store!r}: {e}")
+
+    def lookup(self, function):
+        """Return the cached (contact, team, business_unit) if the function is unchanged, else None."""
+        entry = self.previous.get(function["FunctionArn"])
+        if (
+            entry
+            and entry["RevisionId"] == function.get("RevisionId")
+            and entry["LastModified"] == function.get("LastModified")
+            and time.time() - entry["CheckedAt"] < self.max_age
+        ):
+            with self._lock:
+                self.current[function["FunctionArn"]] = entry
+                self.reused += 1
+            return tuple(entry["Tags"])
+        return None
+
+    def record(self, function, tags):
+        """Remember freshly fetched tags for the function."""
+        with self._lock:
+            self.current[function["FunctionArn"]] = {
+                "LastModified": function.get("LastModified"),
+                "RevisionId": function.get("RevisionId"),
+                "Runtime": function.get("Runtime", "Unknown"),
+                "Tags": list(tags),
+                "CheckedAt": time.time(),
+            }
+            self.fetched += 1
+
+    def save(self, partial=False):
+        """Write the functions seen in this run back to the store (deleted functions drop out).
 
-def get_lambda_functions(region):
-    """Fetch all Lambda functions in a region and their details."""
-    client = boto3.client("lambda", region_name=region)
+        With partial=True, for a run split across invocations, the previous entries are
+        kept as well, since this invocation did not see every region.
+        """
+        functions = dict(self.previous, **self.current) if partial else self.current
+        self.store.write(json.dumps({"functions": functions}, separators=(",", ":")).encode())
+        print(f"Snapshot: reused tags for {self.reused} functions, fetched {self.fetched}.")
+
+    def export(self):
+        """Return the entries and counts of this run, for another process to merge()."""
+        with self._lock:
+            return {"functions": dict(self.current), "reused": self.reused, "fetched": self.fetched}
+
+    def merge(self, exported):
+        """Add the entries and counts that export() returned in another process, such as a shard."""
+        with self._lock:
+            self.current.update(exported["functions"])
+            self.reused += exported["reused"]
+            self.fetched += exported["fetched"]
+
+def resolve_function_tags(client, function, snapshot=None):
+    """Return (contact, team, business_unit), reusing the snapshot when the function is unchanged."""
+    if snapshot is not None:
+        tags = snapshot.lookup(function)
+        if tags is not None:
+            return tags
+    tags = get_lambda_tags(client, function["FunctionArn"])
+    if snapshot is not None:
+        snapshot.record(function, tags)
+    return tags
+
+def get_lambda_functions(region, snapshot=None, account_id=None):
+    """Fetch all Lambda functions in a region (of account_id, if given) and their details."""
+    client = get_client("lambda", region, account_id)
     deprecated_list = []
     soon_deprecated_list = []
-    
+
+    functions = []
     paginator = client.get_paginator("list_functions")
     for page in paginator.paginate():
-        for function in page["Functions"]:
-            function_name = function["FunctionName"]
-            function_arn = function["FunctionArn"]
-            runtime = function.get("Runtime", "Unknown")
+        functions.extend(page["Functions"])
+
+    # Phase 1: classify from the list_functions data alone
+    flagged = []
+    for function in functions:
+        status = get_runtime_status(function.get("Runtime", "Unknown"))
+        if status:
+            flagged.append((function, status))
 
-            # Fetch tags: contact, team, business unit
-            contact, team, business_unit = get_lambda_tags(client, function_arn)
+    with _tag_stats_lock:
+        TAG_LOOKUP_STATS["functions"] += len(functions)
+        TAG_LOOKUP_STATS["flagged"] += len(flagged)
 
-            if runtime in DEPRECATED_RUNTIMES:
-                deprecated_list.append((function_name, runtime, region, contact, team, business_unit, "Deprecated"))
-            elif runtime in SOON_TO_BE_DEPRECATED:
-                soon_deprecated_list.append((function_name, runtime, region, contact, team, business_unit, "Soon to be Deprecated"))
+    # Phase 2: fetch tags (contact, team, business unit) only for flagged functions,
+    # concurrently, with results kept in function order
+    with ThreadPoolExecutor(max_workers=TAG_WORKERS) as pool:
+        function_tags = pool.map(lambda item: resolve_function_tags(client, item[0], snapshot), flagged)
+
+        for (function, status), (contact, team, business_unit) in zip(flagged, function_tags):
+            row = (function["FunctionName"], function.get("Runtime", "Unknown"), region, contact, team, business_unit, status, account_id)
+            if status == "Deprecated":
+                deprecated_list.append(row)
+            else:
+                soon_deprecated_list.append(row)
 
     return deprecated_list, soon_deprecated_list
 
+def get_runtime_status(runtime):
+    """Return 'Deprecated', 'Soon to be Deprecated' or None for a runtime."""
+    if runtime in DEPRECATED_RUNTIMES:
+        return "Deprecated"
+    if runtime in SOON_TO_BE_DEPRECATED:
+        return "Soon to be Deprecated"
+    return None
+
 def get_lambda_tags(client, function_arn):
     """Fetches 'contact', 'team', and 'businessunit' tags for a Lambda function."""
     try:
-        response = client.list_tags(Resource=function_arn)
-        tags = response.get("Tags", {})
+        tag_cache = get_tag_cache()
+        tags = tag_cache.get(function_arn)
+        if tags is None:
+            response = client.list_tags(Resource=function_arn)
+            tags = response.get("Tags", {})
+            tag_cache.put(function_arn, tags)
 
         contact = tags.get("contact") or tags.get("mnfgroup:contact") or "N/A"
         team = tags.get("team") or tags.get("mnfgroup:team") or "N/A"
@@ -64,11 +205,19 @@ def get_lambda_tags(client, function_arn):
 
 def generate_html_report(deprecated, soon_deprecated):
     """Generates an HTML report for deprecated and soon-to-be-deprecated Lambda functions."""
-    html = """
+    report = HtmlReport("lambda_deprecated_runtimes")
+    headers = ["Function Name", "Runtime", "Region", "Contact", "Team", "Business Unit", "Deprecated Status"]
+    # Rows end with the account ID, which is only shown in organization scans
+    width = len(headers)
+    if any(row[7] for row in deprecated) or any(row[7] for row in soon_deprecated):
+        headers.append("Account")
+        width += 1
+
+    report.raw("""
     <html>
     <head>
         <style>
-            table { width: 100%%; border-collapse: collapse; }
+            table { width: 100%; border-collapse: collapse; }
             th, td { border: 1px solid black; padding: 8px; text-align: left; }
             th { background-color: #f2f2f2; }
         </style>
@@ -77,73 +226,167 @@ def generate_html_report(deprecated, soon_deprecated):
         <h2>Attention: Deprecated AWS Lambda Runtimes Detected</h2>
         <p>The following Lambda functions are using deprecated or soon-to-be-deprecated runtimes. Please update them as soon as possible to ensure continued functionality and security.</p>
         <h3>Lambda Functions Using Deprecated Runtimes</h3>
-        <table>
-            <tr>
-                <th>Function Name</th><th>Runtime</th><th>Region</th><th>Contact</th><th>Team</th><th>Business Unit</th><th>Deprecated Status</th>
-            </tr>
-    """
-    for fn, rt, reg, contact, team, business_unit, status in deprecated:
-        html += f"<tr><td>{fn}</td><td>{rt}</td><td>{reg}</td><td>{contact}</td><td>{team}</td><td>{business_unit}</td><td>{status}</td></tr>"
+    """)
+    with report.table(headers, caption="Deprecated", attrs="") as rows:
+        for function_row in deprecated:
+            rows.row(function_row[:width])
 
-    html += """
-        </table>
+    report.raw("""
         <h3>Lambda Functions Using Soon-To-Be Deprecated Runtimes</h3>
-        <table>
-            <tr>
-                <th>Function Name</th><th>Runtime</th><th>Region</th><th>Contact</th><th>Team</th><th>Business Unit</th><th>Deprecated Status</th>
-            </tr>
-    """
-    for fn, rt, reg, contact, team, business_unit, status in soon_deprecated:
-        html += f"<tr><td>{fn}</td><td>{rt}</td><td>{reg}</td><td>{contact}</td><td>{team}</td><td>{business_unit}</td><td>{status}</td></tr>"
+    """)
+    with report.table(headers, caption="Soon to be Deprecated", attrs="") as rows:
+        for function_row in soon_deprecated:
+            rows.row(function_row[:width])
 
-    html += """
-        </table>
+    report.raw("""
         <p><strong>Action Required:</strong> Please update the deprecated Lambda functions to a supported runtime as soon as possible to avoid service disruptions.</p>
     </body>
     </html>
-    """
-    return html
+    """)
+    return report.render()
 
-def send_email(html_report, recipient_email, sender_email, region="ap-southeast-2"):
-    """Sends the HTML report via AWS SES."""
-    client = boto3.client("ses", region_name=region)
+def send_reports(deprecated, soon_deprecated, recipient_email, sender_email, region="ap-southeast-2"):
+    """Send the full report to recipient_email and a digest of their own functions to each contact."""
+    subject = "AWS Lambda Deprecated Runtime Report"
+    messages = [([recipient_email], subject, generate_html_report(deprecated, soon_deprecated))]
+
+    # One digest per owner, from the 'contact' tag column
+    digests = partition_by_contact(deprecated + soon_deprecated, lambda row: row[3])
+    for contact, rows in digests.items():
+        messages.append((
+            [contact],
+            subject,
+            generate_html_report([row for row in rows if row[6] == "Deprecated"], [row for row in rows if row[6] != "Deprecated"]),
+        ))
 
     try:
-        response = client.send_email(
-            Source=sender_email,
-            Destination={"ToAddresses": [recipient_email]},
-            Message={
-                "Subject": {"Data": "AWS Lambda Deprecated Runtime Report"},
-                "Body": {"Html": {"Data": html_report}},
-            },
-        )
-        print(" Email sent successfully!")
+        deliver_messages(get_client("ses", region), sender_email, messages, SEND_WORKERS)
     except NoCredentialsError:
         print(" AWS credentials not found!")
+
+def _decode_rows(result):
+    """Turn a region's (deprecated, soon_deprecated) rows read back from a checkpoint into tuples again."""
+    deprecated, soon_deprecated = result
+    return [tuple(row) for row in deprecated], [tuple(row) for row in soon_deprecated]
+
+def scan_region(region, snapshot=None, account_id=None):
+    """Scan one region, returning empty results if the region cannot be read."""
+    print(f"🔍 Scanning region: {region}{f' in {account_id}' if account_id else ''} ...")
+    try:
+        return get_lambda_functions(region, snapshot, account_id)
     except ClientError as e:
-        print(f" Error sending email: {e}")
+        print(f"Error scanning region {region}{f' in {account_id}' if account_id else ''}: {e}")
+        return [], []
 
-def lambda_handler(event, context):
-    regions = ["ap-southeast-2", "ap-southeast-1","us-east-1"]  # Add required regions
+def scan_shard(shard):
+    """Scan a shard's accounts (organization scans) or regions.
+
+    Returns its flagged function rows and the snapshot entries of the functions it saw;
+    the coordinator writes the snapshot once, so concurrent shards cannot overwrite it.
+    """
+    snapshot = FunctionSnapshot(open_store(SNAPSHOT_LOCATION)) if SNAPSHOT_LOCATION else None
+    if "accounts" in shard:
+        results = [result for _, result in scan_accounts(
+            lambda account_id, region: scan_region(region, snapshot, account_id), shard["accounts"], REGIONS)]
+    else:
+        results = scan_regions(lambda region: scan_region(region, snapshot), shard["regions"], MAX_WORKERS)
+    return {
+        "rows": [row for deprecated, soon_deprecated in results for row in deprecated + soon_deprecated],
+        "snapshot": snapshot.export() if snapshot is not None else None,
+    }
+
+def get_lambda_functions_sharded(context=None, initializer=None, initargs=()):
+    """Scan the regions (or accounts) in SHARD_COUNT shards and merge their rows.
+
+    Returns (deprecated, soon_deprecated) without duplicates, in account, region and
+    function name order.
+    """
+    accounts = get_scan_accounts()
+    if accounts:
+        shards = plan_shards("check_lambda_runtime", accounts, SHARD_COUNT, "accounts")
+    else:
+        shards = plan_shards("check_lambda_runtime", REGIONS or get_regions(), SHARD_COUNT, "regions")
+    dispatch_shards(scan_shard, shards, context, initializer, initargs)
+    snapshot = FunctionSnapshot(open_store(SNAPSHOT_LOCATION)) if SNAPSHOT_LOCATION else None
+
+    def merge_snapshot(result):
+        if snapshot is not None and result.get("snapshot"):
+            snapshot.merge(result["snapshot"])
+
+    rows = [tuple(row) for row in merge_shard_results(shards, key=lambda row: (row[7] or "", row[2], row[0]),
+                                                      on_result=merge_snapshot)]
+    if snapshot is not None:
+        # Every shard's entries are merged, so functions no shard saw drop out
+        snapshot.save()
+    return [row for row in rows if row[6] == "Deprecated"], [row for row in rows if row[6] != "Deprecated"]
+
+def scan_all_regions(event, context):
+    """Scan every region (or account/region pair) in this invocation.
+
+    Returns (deprecated, soon_deprecated), or the continuation when the Lambda deadline
+    stopped the scan.
+    """
+    accounts = get_scan_accounts()
+    snapshot = FunctionSnapshot(open_store(SNAPSHOT_LOCATION)) if SNAPSHOT_LOCATION else None
+    TAG_LOOKUP_STATS.update(functions=0, flagged=0)
+    get_tag_cache().reset_stats()
+    # Regions (or account/region pairs) are checkpointed units, so a scan stopped near the
+    # Lambda deadline continues where it left off
+    scheduler = DeadlineScheduler("check_lambda_runtime", event, context)
     all_deprecated = []
     all_soon_deprecated = []
 
-    for region in regions:
-        print(f"🔍 Scanning region: {region} ...")
-        deprecated, soon_deprecated = get_lambda_functions(region)
+    if accounts:
+        # Organization scan: every (account, region) pair on one bounded pool, merged in account order
+        pairs = list_account_regions(accounts, REGIONS)
+        scan_pair = releasing_clients(lambda account_id, region: scan_region(region, snapshot, account_id),
+                                      scheduler.pending(pairs))
+        results = scheduler.run(pairs, scan_pair, ORG_MAX_WORKERS, decode=_decode_rows)
+    else:
+        # Regions are scanned concurrently; results are merged in region order
+        results = scheduler.run(REGIONS or get_regions(), lambda region: scan_region(region, snapshot), MAX_WORKERS,
+                                decode=_decode_rows)
+
+    if snapshot is not None:
+        snapshot.save(partial=scheduler.checkpointed)
+    if results is None:
+        return scheduler.suspend()
+
+    for deprecated, soon_deprecated in results:
         all_deprecated.extend(deprecated)
         all_soon_deprecated.extend(soon_deprecated)
 
+    skipped = TAG_LOOKUP_STATS["functions"] - TAG_LOOKUP_STATS["flagged"]
+    print(f"Classified {TAG_LOOKUP_STATS['functions']} functions; {TAG_LOOKUP_STATS['flagged']} need reporting, "
+          f"{skipped} tag lookups avoided.")
+    get_tag_cache().report()
+
+    return all_deprecated, all_soon_deprecated
+
+@profile_handler("check_lambda_runtime")
+@emit_metrics("check_lambda_runtime")
+def lambda_handler(event, context):
+    # Invoked by a coordinator to scan one shard
+    shard = shard_from_event(event)
+    if shard is not None:
+        return {"rows": run_shard(scan_shard, shard)}
+
+    if SHARD_COUNT > 1:
+        all_deprecated, all_soon_deprecated = get_lambda_functions_sharded(context)
+    else:
+        results = scan_all_regions(event, context)
+        if isinstance(results, dict):
+            return results  # Continuation of a scan stopped near the deadline
+        all_deprecated, all_soon_deprecated = results
+
     if not all_deprecated and not all_soon_deprecated:
         print("\n No deprecated Lambda functions found.")
         return
 
-    html_report = generate_html_report(all_deprecated, all_soon_deprecated)
-
     # Replace with actual email addresses
     recipient_email = "rahul.chaudhary@symbio.global"
     sender_email = "no-reply@symbio.global"
-    send_email(html_report, recipient_email, sender_email)
+    send_reports(all_deprecated, all_soon_deprecated, recipient_email, sender_email)
 
 if __name__ == "__main__":
     lambda_handler([], [])
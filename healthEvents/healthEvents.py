@@ -1,13 +1,28 @@
-import boto3
 import json
 import logging
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared aws_common package
+
+from aws_common.clients import get_client
+from aws_common.eventstate import get_event_state
+from aws_common.health import (
+    fetch_event_details,
+    group_affected_entities,
+    iter_affected_entities,
+    parse_health_notification,
+)
+from aws_common.mail import send_html_email
+from aws_common.metrics import emit_metrics
+from aws_common.profiling import profile_handler
+from aws_common.report import HtmlReport
 
 # AWS Clients
 #session = boto3.Session(profile_name="AdminRole-526424395864")
 ENV = os.getenv('ENV')
-health_client = boto3.client('health', region_name="us-east-1")
-ses_client = boto3.client('ses', region_name='ap-southeast-2')  # Change if needed
+HEALTH_REGION = "us-east-1"  # AWS Health API endpoint region
+SES_REGION = os.getenv("SES_REGION", "ap-southeast-2")  # Region where SES is configured
 
 # SES Configurations
 SENDER_EMAIL = "aws-alerts@symbio.global"  # Replace with verified SES sender email
@@ -16,152 +31,202 @@ DEFAULT_RECIPIENT = "symbio_core_cloud@mnfgroup.limited"  # Default recipient
 SUBJECT = f"AWS {ENV} Health Dashboard - Upcoming Events"
 
 logging.basicConfig()
-logger = logging.getLogger()
+logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+def get_health_client():
+    """Return the AWS Health client, created on first use and reused across warm invocations."""
+    return get_client('health', HEALTH_REGION)
+
+def get_ses_client():
+    """Return the SES client, created on first use and reused across warm invocations."""
+    return get_client('ses', SES_REGION)
+
+def list_events(since=None):
+    """Fetch upcoming AWS Health events, or with since, every event updated since then, following pagination."""
+    event_filter = {"eventStatusCodes": ["upcoming"]} if since is None else {"lastUpdatedTimes": [{"from": since}]}
+    events = []
+    for page in get_health_client().get_paginator("describe_events").paginate(filter=event_filter):
+        events.extend(page.get("events", []))
+    return events
 
 def get_upcoming_events():
-    """Fetch upcoming AWS Health events and exclude RDS lifecycle events."""
-    response = health_client.describe_events(
-        filter={"eventStatusCodes": ["upcoming"]}
-    )
-    events = response.get("events", [])
-    
+    """Return the upcoming AWS Health events, excluding RDS lifecycle events.
+
+    Only events updated since the last run are listed; the rest come from the event state.
+    """
     # Exclude RDS lifecycle maintenance events
-    filtered_events = [event for event in events if not event["eventTypeCode"].startswith("AWS_RDS_PLANNED_LIFECYCLE_EVENT")]
-    
-    return filtered_events
-
-def get_affected_entities(event_arn):
-    """Fetch affected resources for a given event."""
-    response = health_client.describe_affected_entities(
-        filter={"eventArns": [event_arn]}
+    return get_event_state("healthEvents").refresh(
+        list_events, keep=lambda event: not event["eventTypeCode"].startswith("AWS_RDS_PLANNED_LIFECYCLE_EVENT")
     )
-    return [entity["entityValue"] for entity in response.get("entities", [])]
 
-def get_event_description(event_arn):
-    """Fetch detailed event description for a given event."""
-    try:
-        response = health_client.describe_event_details(
-            eventArns=[event_arn]
-        )
-        if response.get("successfulSet"):
-            return response["successfulSet"][0]["eventDescription"].get("latestDescription", "No details provided")
-    except Exception as e:
-        print(f"Error fetching event description: {e}")
+def get_affected_entities(event_arns):
+    """Fetch affected resources for all given events as {event_arn: [resources]}."""
+    return group_affected_entities(iter_affected_entities(get_health_client(), event_arns))
+
+def get_event_details(event_arns):
+    """Fetch description and tags for all events at once, 10 events per API call."""
+    return fetch_event_details(get_health_client(), event_arns)
+
+def fetch_event_data(event_arns):
+    """Fetch details and affected resources for new or updated events as {event_arn: {"details", "entities"}}."""
+    event_details = get_event_details(event_arns)
+    event_entities = get_affected_entities(event_arns)
+    return {arn: {"details": event_details.get(arn), "entities": event_entities.get(arn, [])} for arn in event_arns}
+
+def get_event_description(event_arn, event_details):
+    """Return the detailed event description for a given event."""
+    details = event_details.get(event_arn)
+    if details:
+        return details.get("eventDescription", {}).get("latestDescription", "No details provided")
     return "No details provided"
 
-def get_event_tags(event_arn):
-    """Fetch tags for a given event and extract the contact email."""
-    try:
-        response = health_client.describe_event_details(
-            eventArns=[event_arn]
-        )
-        if response.get("successfulSet"):
-            tags = response["successfulSet"][0].get("tags", {})
-            return tags.get("contact", DEFAULT_RECIPIENT)  # Default to Rahul's email if not found
-    except Exception as e:
-        print(f"Error fetching event tags: {e}")
+def get_event_tags(event_arn, event_details):
+    """Return the contact email from a given event's tags."""
+    details = event_details.get(event_arn)
+    if details:
+        return details.get("tags", {}).get("contact", DEFAULT_RECIPIENT)  # Default to Rahul's email if not found
     return DEFAULT_RECIPIENT
 
-def format_html_message(events):
-    """Format the AWS Health events data into an HTML table and a separate event description section."""
+def format_html_message(events, event_data=None):
+    """Format the AWS Health events data into an HTML table and a separate event description section.
+
+    event_data ({event_arn: {"details", "entities"}}) is read from the event state when not given.
+    """
     if not events:
         return "<p>No upcoming AWS RDS Planned Lifecycle Events.</p>", []  # Ensure two values are always returned
 
-    message_body = """
+    report = HtmlReport("health_events")
+    report.raw("""
     <p>Dear Team,</p>
     <p>Please find below the upcoming AWS Health events that may impact our infrastructure.</p>
     <p>Take necessary actions if required.</p>
-    """
+    """)
 
-    # Table for events
-    table_header = """
-    <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; width: 100%;">
-        <thead>
-            <tr>
-                <th>Event</th>
-                <th>Service</th>
-                <th>Region</th>
-                <th>Start Time</th>
-                <th>Affected Resources</th>
-                <th>Contact</th>
-            </tr>
-        </thead>
-        <tbody>
-    """
-    
-    table_rows = []
-    event_descriptions = []
     recipient_emails = {DEFAULT_RECIPIENT}  # Use a set to ensure unique emails
 
+    # Description, tags and affected resources from the event state, fetched (in batches) only for new or updated events
+    # Events whose details could not be fetched are fetched again next run
+    if event_data is None:
+        event_data = get_event_state("healthEvents").fetch_missing(
+            [event["arn"] for event in events], fetch_event_data, complete=lambda data: data["details"] is not None
+        )
+    event_details = {arn: data["details"] for arn, data in event_data.items() if data["details"]}
+    event_entities = {arn: data["entities"] for arn, data in event_data.items()}
+
+    # Table for events
+    headers = ["Event", "Service", "Region", "Start Time", "Affected Resources", "Contact"]
+    with report.table(headers) as rows:
+        for event in events:
+            event_arn = event["arn"]
+            affected_resources = event_entities.get(event_arn, [])
+            contact_email = get_event_tags(event_arn, event_details)  # Fetch "contact" tag
+
+            recipient_emails.add(contact_email)  # Add unique contacts to recipient list
+
+            # Handle cases where no affected resources are found
+            if not affected_resources:
+                affected_resources = ["None"]
+
+            # Create table rows, each affected resource gets its own row
+            for idx, resource in enumerate(affected_resources):
+                if idx == 0:
+                    rows.row([event['eventTypeCode'], event['service'], event.get('region', 'Global'),
+                              event.get('startTime', 'Unknown'), resource, contact_email])
+                else:
+                    rows.row(["", "", "", "", resource, ""])
+
+    # Add event descriptions separately
     for event in events:
-        event_arn = event["arn"]
-        affected_resources = get_affected_entities(event_arn)
-        event_description = get_event_description(event_arn)  # Fetch description
-        contact_email = get_event_tags(event_arn)  # Fetch "contact" tag
-
-        recipient_emails.add(contact_email)  # Add unique contacts to recipient list
-
-        # Handle cases where no affected resources are found
-        if not affected_resources:
-            affected_resources = ["None"]
-
-        # Create table rows, each affected resource gets its own row
-        for idx, resource in enumerate(affected_resources):
-            table_row = f"""
-            <tr>
-                <td>{event['eventTypeCode'] if idx == 0 else ''}</td>
-                <td>{event['service'] if idx == 0 else ''}</td>
-                <td>{event.get('region', 'Global') if idx == 0 else ''}</td>
-                <td>{event.get('startTime', 'Unknown') if idx == 0 else ''}</td>
-                <td>{resource}</td>
-                <td>{contact_email if idx == 0 else ''}</td>
-            </tr>
-            """
-            table_rows.append(table_row)
-
-        # Add event description separately
-        event_descriptions.append(f"""
-        <p><strong>--- Event ---</strong></p>
-        <p><strong>Event Type:</strong> {event['eventTypeCode']}</p>
-        <p><strong>Service:</strong> {event['service']}</p>
-        <p><strong>Region:</strong> {event.get('region', 'Global')}</p>
-        <p><strong>Start Time:</strong> {event.get('startTime', 'Unknown')}</p>
-        <p><strong>Description:</strong> {event_description}</p>
-        """)
-
-    table_footer = "</tbody></table>"
-
-    closing_message = """
+        event_description = get_event_description(event["arn"], event_details)  # Fetch description
+        report.raw("<p><strong>--- Event ---</strong></p><p><strong>Event Type:</strong> ")
+        report.text(event['eventTypeCode'])
+        report.raw("</p><p><strong>Service:</strong> ")
+        report.text(event['service'])
+        report.raw("</p><p><strong>Region:</strong> ")
+        report.text(event.get('region', 'Global'))
+        report.raw("</p><p><strong>Start Time:</strong> ")
+        report.text(event.get('startTime', 'Unknown'))
+        report.raw("</p><p><strong>Description:</strong> ")
+        report.text(event_description)
+        report.raw("</p>")
+
+    report.raw("""
     <p>For further details, please check the AWS Health Dashboard or reach out to the relevant contacts.</p>
     <p>Best Regards,<br>Cloud Platform Team</p>
-    """
+    """)
 
-    # Combine everything
-    return message_body + table_header + "".join(table_rows) + table_footer + "".join(event_descriptions) + closing_message, list(recipient_emails)
+    return report.render(), list(recipient_emails)
 
 def send_email(subject, body_html, recipients):
-    """Send HTML email using AWS SES."""
+    """Send HTML email using AWS SES; return whether it was sent."""
     try:
-        response = ses_client.send_email(
-            Source=SENDER_EMAIL,
-            Destination={'ToAddresses': recipients},  # Send to all distinct recipients
-            Message={
-                'Subject': {'Data': subject},
-                'Body': {'Html': {'Data': body_html}},
-            }
-        )
+        # Send to all distinct recipients, as a raw message when the full table is attached
+        response = send_html_email(get_ses_client(), SENDER_EMAIL, recipients, subject, body_html)
         print(f"Email sent! Message ID: {response['MessageId']}")
+        return True
     except Exception as e:
         print(f"Error sending email: {e}")
+        return False
 
+@profile_handler("healthEvents")
+@emit_metrics("healthEvents")
 def lambda_handler(event, context):
     events = get_upcoming_events()
     html_message, recipients = format_html_message(events)
     send_email(SUBJECT, html_message, recipients)
 
+@profile_handler("healthEvents")
+@emit_metrics("healthEvents")
+def eventbridge_handler(event, context):
+    """Handle one AWS Health event pushed by EventBridge: update the event state and notify about that event."""
+    try:
+        health_event, description, entities = parse_health_notification(event)
+    except ValueError as e:
+        print(f"Ignoring event: {e}")
+        return
+    event_arn = health_event["arn"]
+    if health_event["eventTypeCode"].startswith("AWS_RDS_PLANNED_LIFECYCLE_EVENT"):
+        print(f"Ignoring RDS lifecycle event {event_arn} (handled by rds_lifecycle_events).")
+        return
+
+    # The notification usually carries the description and entities; the API is only asked for what it lacks
+    if description is None:
+        details = get_event_details([event_arn]).get(event_arn)
+    else:
+        details = {"event": health_event, "eventDescription": {"latestDescription": description}}
+    if entities is None:
+        resources = get_affected_entities([event_arn]).get(event_arn, [])
+    else:
+        resources = [entity["entityValue"] for entity in entities]
+        # Contact from the affected entities' tags, when the event itself has none
+        contacts = [entity.get("tags", {}).get("contact") for entity in entities if entity.get("tags", {}).get("contact")]
+        if details is not None and contacts and "contact" not in details.get("tags", {}):
+            details["tags"] = dict(details.get("tags", {}), contact=contacts[0])
+
+    state = get_event_state("healthEvents")
+    event_data = {"details": details, "entities": resources}
+    if health_event.get("statusCode", "upcoming") != "upcoming":
+        state.put(health_event, event_data)
+        print(f"Event {event_arn} is {health_event.get('statusCode')}, removed from the event state.")
+        return
+    if state.is_current(health_event):
+        print(f"Event {event_arn} is unchanged, already notified.")
+        return
+
+    html_message, recipients = format_html_message([health_event], {event_arn: event_data})
+    if not send_email(f"{SUBJECT}: {health_event['eventTypeCode']}", html_message, recipients):
+        # Not stored yet, so the retried invocation notifies again
+        raise RuntimeError(f"Notification for event {event_arn} was not sent")
+    # Stored once notified; without details it is not, so that the next poll fetches them again
+    if details is not None:
+        state.put(health_event, event_data)
+
 if __name__ == "__main__":
-    lambda_handler([], [])
+    # With sample EventBridge payloads as arguments, run the push handler on each
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            with open(path) as f:
+                eventbridge_handler(json.load(f), None)
+    else:
+        lambda_handler([], [])
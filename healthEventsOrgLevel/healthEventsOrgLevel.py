@@ -1,52 +1,189 @@
-import boto3
+import asyncio
 import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared aws_common package
+
+from aws_common.clients import get_client
+from aws_common.eventstate import get_event_state
+from aws_common.health import (
+    get_organization_affected_accounts,
+    group_affected_entities,
+    iter_organization_entity_batch,
+    plan_organization_entity_batches,
+)
+from aws_common.mail import send_html_email
+from aws_common.metrics import emit_metrics
+from aws_common.profiling import profile_handler
+from aws_common.report import HtmlReport
+from aws_common.scheduler import DeadlineScheduler
+from aws_common.shards import SHARD_COUNT, dispatch_shards, merge_shard_results, plan_shards, run_shard, shard_from_event
+
 # AWS Clients
-health_client = boto3.client('health', region_name="us-east-1")
-ses_client = boto3.client('ses', region_name='ap-southeast-2')  # Change if necessary
+HEALTH_REGION = "us-east-1"  # AWS Health API endpoint region
+SES_REGION = os.getenv("SES_REGION", "ap-southeast-2")  # Region where SES is configured
 
 SENDER_EMAIL = ""  # Replace with your verified sender email
 RECIPIENT_EMAIL = ""  # Replace with recipient email
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "16"))  # Concurrent AWS Health API calls
+EVENTS_PER_UNIT = int(os.getenv("EVENTS_PER_UNIT", "50"))  # Events per checkpointed unit of work
+
+def get_health_client():
+    """Return the AWS Health client, created on first use and reused across warm invocations."""
+    # Up to MAX_IN_FLIGHT calls share this client, so its pool keeps that many connections alive
+    return get_client('health', HEALTH_REGION, max_pool_connections=max(10, MAX_IN_FLIGHT))
+
+def get_ses_client():
+    """Return the SES client, created on first use and reused across warm invocations."""
+    return get_client('ses', SES_REGION)
+
+def list_organization_events(since=None):
+    """Fetch upcoming organization AWS Health events, or with since, every one updated since then."""
+    event_filter = {"eventStatusCodes": ["upcoming"]} if since is None else {"lastUpdatedTime": {"from": since}}
+    events = []
+    for page in get_health_client().get_paginator("describe_events_for_organization").paginate(filter=event_filter):
+        events.extend(page.get("events", []))
+    return events
 
 def get_organization_events():
-    """Fetch upcoming AWS Health events at the organization level."""
-    response = health_client.describe_events_for_organization(
-        filter={"eventStatusCodes": ["upcoming"]}
-    )
-    return response.get("events", [])
+    """Return the upcoming AWS Health events at the organization level.
+
+    Only events updated since the last run are listed; the rest come from the event state.
+    """
+    return get_event_state("healthEventsOrgLevel").refresh(list_organization_events)
 
 def get_affected_accounts(event_arn):
     """Fetch affected AWS accounts for a given event."""
-    response = health_client.describe_affected_accounts_for_organization(
-        eventArn=event_arn
-    )
-    return response.get("affectedAccounts", [])
+    return get_organization_affected_accounts(get_health_client(), event_arn)
 
-def get_affected_entities(event_arn, account_id):
-    """Fetch affected resources for a given event and account."""
-    response = health_client.describe_affected_entities_for_organization(
-        organizationEntityFilters=[{"eventArn": event_arn, "awsAccountId": account_id}]
-    )
-    return [entity["entityValue"] for entity in response.get("entities", [])]
+def get_affected_entity_batch(filters):
+    """Fetch affected resources for one batch of up to 10 organizationEntityFilters."""
+    return group_affected_entities(iter_organization_entity_batch(get_health_client(), filters))
+
+async def collect_affected_resources_async(events, max_in_flight=MAX_IN_FLIGHT):
+    """Walk events -> affected accounts -> entities with at most max_in_flight API calls at once.
+
+    Returns ([(event, [account_id, ...]), ...] in event order, {(event_arn, account_id): [resources]}).
+    """
+    loop = asyncio.get_running_loop()
+    # boto3 is blocking, so calls run on a dedicated pool whose size is the in-flight limit
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+        accounts = await asyncio.gather(
+            *(loop.run_in_executor(pool, get_affected_accounts, event["arn"]) for event in events)
+        )
+        event_accounts = list(zip(events, accounts))
+
+        batches = plan_organization_entity_batches(
+            [(event["arn"], account_id) for event, affected_accounts in event_accounts for account_id in affected_accounts]
+        )
+        batch_entities = await asyncio.gather(
+            *(loop.run_in_executor(pool, get_affected_entity_batch, filters) for filters in batches)
+        )
+
+    pair_entities = {}
+    for entities in batch_entities:
+        pair_entities.update(entities)
+    return event_accounts, pair_entities
+
+def collect_affected_resources(events, max_in_flight=MAX_IN_FLIGHT):
+    """Synchronous wrapper around collect_affected_resources_async, for main() and lambda_handler."""
+    return asyncio.run(collect_affected_resources_async(events, max_in_flight))
+
+def collect_affected_resources_by_unit(events, scheduler):
+    """Collect affected accounts and entities EVENTS_PER_UNIT events at a time, as units of the scheduler.
+
+    Returns the same as collect_affected_resources, or None when the Lambda deadline
+    stopped the run (the finished units are checkpointed).
+    """
+    events_by_arn = {event["arn"]: event for event in events}
+    arns = list(events_by_arn)
+    units = [arns[start:start + EVENTS_PER_UNIT] for start in range(0, len(arns), EVENTS_PER_UNIT)]
+
+    def collect(unit):
+        event_accounts, pair_entities = collect_affected_resources([events_by_arn[arn] for arn in unit])
+        return {
+            "accounts": [[event["arn"], accounts] for event, accounts in event_accounts],
+            "entities": [[event_arn, account_id, resources] for (event_arn, account_id), resources in pair_entities.items()],
+        }
+
+    # Units run one at a time; each one already keeps MAX_IN_FLIGHT calls going
+    results = scheduler.run(units, collect, max_workers=1)
+    if results is None:
+        return None
 
-def format_html_message(events):
-    """Format the email message in HTML, grouping by account."""
+    event_accounts = []
+    pair_entities = {}
+    for result in results:
+        event_accounts.extend((events_by_arn[event_arn], accounts) for event_arn, accounts in result["accounts"])
+        pair_entities.update(((event_arn, account_id), resources) for event_arn, account_id, resources in result["entities"])
+    return event_accounts, pair_entities
+
+def collect_event_data(event_arns, scheduler=None, context=None):
+    """Collect the affected accounts and entities of events as {event_arn: {"accounts", "entities"}}.
+
+    Sharded when SHARD_COUNT is above 1, checkpointed with a scheduler (None is then returned
+    when the Lambda deadline stopped it), and otherwise in this invocation.
+    """
+    # Resolve affected accounts per event, then the entities of every (event, account) pair in batches of 10,
+    # with the API calls running concurrently
+    events = [{"arn": event_arn} for event_arn in event_arns]
+    if SHARD_COUNT > 1:
+        collected = collect_affected_resources_sharded(events, context)
+    elif scheduler is None:
+        collected = collect_affected_resources(events)
+    else:
+        collected = collect_affected_resources_by_unit(events, scheduler)
+        if collected is None:
+            return None
+    event_accounts, pair_entities = collected
+    return {
+        event["arn"]: {
+            "accounts": accounts,
+            "entities": {account_id: pair_entities[(event["arn"], account_id)]
+                         for account_id in accounts if (event["arn"], account_id) in pair_entities},
+        }
+        for event, accounts in event_accounts
+    }
+
+def format_html_message(events, scheduler=None, context=None):
+    """Format the email message in HTML, grouping by account.
+
+    Affected accounts and entities come from the event state and are collected only for new
+    or updated events. With a scheduler, None is returned when the Lambda deadline stopped them.
+    """
     if not events:
         return "<p>No upcoming AWS Health events.</p>"
 
+    event_data = get_event_state("healthEventsOrgLevel").fetch_missing(
+        [event["arn"] for event in events], lambda event_arns: collect_event_data(event_arns, scheduler, context)
+    )
+    if event_data is None:
+        return None
+
+    event_accounts = []
+    pair_entities = {}
+    for event in events:
+        data = event_data.get(event["arn"], {"accounts": [], "entities": {}})
+        event_accounts.append((event, data["accounts"]))
+        pair_entities.update(((event["arn"], account_id), resources) for account_id, resources in data["entities"].items())
+    return render_html_message(event_accounts, pair_entities)
+
+def render_html_message(event_accounts, pair_entities):
+    """Render [(event, [account_id, ...])] and {(event_arn, account_id): [resources]} as HTML, grouped by account."""
     account_events = {}
 
     # Organize events per account
-    for event in events:
+    for event, affected_accounts in event_accounts:
         event_arn = event["arn"]
-        affected_accounts = get_affected_accounts(event_arn)
 
         for account_id in affected_accounts:
             if account_id not in account_events:
                 account_events[account_id] = []
 
-            affected_resources = get_affected_entities(event_arn, account_id)
+            affected_resources = pair_entities.get((event_arn, account_id), [])
             resources_list = ', '.join(affected_resources) if affected_resources else "None"
 
             account_events[account_id].append({
@@ -59,60 +196,79 @@ def format_html_message(events):
             })
 
     # Generate HTML tables per account
-    html_body = "<h2>AWS Health Dashboard - Upcoming Events</h2>"
+    report = HtmlReport("health_events_organization")
+    report.raw("<h2>AWS Health Dashboard - Upcoming Events</h2>")
+    headers = ["Event", "Service", "Region", "Start Time", "Description", "Affected Resources"]
 
     for account_id, event_list in account_events.items():
-        html_body += f"<h3>Affected Account: {account_id}</h3>"
-        html_body += """
-        <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; width: 100%;">
-            <thead>
-                <tr>
-                    <th>Event</th>
-                    <th>Service</th>
-                    <th>Region</th>
-                    <th>Start Time</th>
-                    <th>Description</th>
-                    <th>Affected Resources</th>
-                </tr>
-            </thead>
-            <tbody>
-        """
-
-        for event in event_list:
-            html_body += f"""
-            <tr>
-                <td>{event['EventTypeCode']}</td>
-                <td>{event['Service']}</td>
-                <td>{event['Region']}</td>
-                <td>{event['StartTime']}</td>
-                <td>{event['Description']}</td>
-                <td>{event['AffectedResources']}</td>
-            </tr>
-            """
-
-        html_body += "</tbody></table><br>"
-
-    return html_body
+        report.raw("<h3>Affected Account: ")
+        report.text(account_id)
+        report.raw("</h3>")
+
+        with report.table(headers, caption=account_id) as rows:
+            for event in event_list:
+                rows.row([event['EventTypeCode'], event['Service'], event['Region'],
+                          event['StartTime'], event['Description'], event['AffectedResources']])
+
+        report.raw("<br>")
+
+    return report.render()
 
 def send_email(subject, body_html):
     """Send HTML email using SES."""
     try:
-        response = ses_client.send_email(
-            Source=SENDER_EMAIL,
-            Destination={'ToAddresses': [RECIPIENT_EMAIL]},
-            Message={
-                'Subject': {'Data': subject},
-                'Body': {'Html': {'Data': body_html}},
-            }
-        )
+        # Sent as a raw message when the full tables are attached
+        response = send_html_email(get_ses_client(), SENDER_EMAIL, [RECIPIENT_EMAIL], subject, body_html)
         print(f"Email sent! Message ID: {response['MessageId']}")
     except Exception as e:
         print(f"Error sending email: {e}")
 
-def main():
+def scan_shard(shard):
+    """Collect the affected accounts and their entities for a shard's events, one row per event."""
+    event_accounts, pair_entities = collect_affected_resources([{"arn": arn} for arn in shard["event_arns"]])
+    return [
+        [event["arn"], [[account_id, pair_entities.get((event["arn"], account_id), [])] for account_id in accounts]]
+        for event, accounts in event_accounts
+    ]
+
+def collect_affected_resources_sharded(events, context=None, initializer=None, initargs=()):
+    """Split the events into SHARD_COUNT shards, collect each shard as a separate worker and merge the results.
+
+    Returns the same as collect_affected_resources, in the order of events.
+    """
+    shards = plan_shards("healthEventsOrgLevel", [event["arn"] for event in events], SHARD_COUNT, "event_arns")
+    dispatch_shards(scan_shard, shards, context, initializer, initargs)
+    accounts_by_arn = dict(merge_shard_results(shards, key=lambda row: row[0]))
+
+    event_accounts = []
+    pair_entities = {}
+    for event in events:
+        affected = accounts_by_arn.get(event["arn"], [])
+        event_accounts.append((event, [account_id for account_id, _ in affected]))
+        for account_id, resources in affected:
+            if resources:
+                pair_entities[(event["arn"], account_id)] = resources
+    return event_accounts, pair_entities
+
+@profile_handler("healthEventsOrgLevel")
+def main(event=None, context=None):
+    # Lookups are checkpointed, so a run stopped near the Lambda deadline continues where it left off
+    # Invoked by a coordinator to collect one shard
+    shard = shard_from_event(event)
+    if shard is not None:
+        return {"rows": run_shard(scan_shard, shard)}
+
+    scheduler = DeadlineScheduler("healthEventsOrgLevel", event, context)
     events = get_organization_events()
-    html_message = format_html_message(events)
+    html_message = format_html_message(events, scheduler, context)
+    if html_message is None:
+        return scheduler.suspend()
     send_email("AWS Health Dashboard - Organizational Events", html_message)
 
+@profile_handler("healthEventsOrgLevel")
+@emit_metrics("healthEventsOrgLevel")
+def lambda_handler(event, context):
+    return main(event, context)
+
 if __name__ == "__main__":
     main()
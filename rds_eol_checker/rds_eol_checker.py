@@ -1,261 +1,401 @@
-import boto3
 import datetime
-from tabulate import tabulate
 from datetime import datetime as dt
+import hashlib
+import json
 import logging
 import os
+import sys
+import threading
+from functools import lru_cache
+
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared aws_common package
+
+from aws_common.accounts import ORG_MAX_WORKERS, get_scan_accounts, list_account_regions, releasing_clients, scan_accounts
+from aws_common.clients import get_client
+from aws_common.delivery import deliver_messages, partition_by_contact
+from aws_common.metrics import emit_metrics
+from aws_common.profiling import profile_handler
+from aws_common.regions import get_regions, scan_regions
+from aws_common.report import HtmlReport
+from aws_common.scheduler import DeadlineScheduler
+from aws_common.shards import SHARD_COUNT, dispatch_shards, merge_shard_results, plan_shards, run_shard, shard_from_event
+from aws_common.store import open_store
+from aws_common.tagcache import get_tag_cache
+from aws_common.tags import get_rds_tags
 
 # Define AWS SES settings (Optional)
-#session = boto3.Session(profile_name="AdminRole-526424395864")
 ENV = os.getenv('ENV')
 SENDER_EMAIL = ""  # Replace with your verified sender email
-RECIPIENT_EMAILS = {""}  # Set to a set for uniqueness
+RECIPIENT_EMAILS = {""}  # Recipients of the full report; contacts get their own digest
 AWS_REGION = "ap-southeast-2"  # Replace with your region
 SUBJECT = f"AWS RDS {ENV} Account - End-of-Support Status"
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))  # Regions scanned in parallel
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))  # Emails sent in parallel (within the SES send rate)
+# End-of-Support catalog: a local path or s3://bucket/key (see eol_catalog.json)
+EOL_CATALOG = os.getenv("EOL_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "eol_catalog.json"))
+# Pre-parsed copy of the catalog, kept next to it so cold starts skip parsing (see --build-catalog-cache)
+EOL_CATALOG_CACHE = os.getenv("EOL_CATALOG_CACHE", EOL_CATALOG[:-len(".json")] + ".cache.json" if EOL_CATALOG.endswith(".json") else EOL_CATALOG + ".cache.json")
+
+# Tag lookup counters for the current run, shared by the region workers
+TAG_LOOKUP_STATS = {"instances": 0, "api_calls": 0}
+_tag_stats_lock = threading.Lock()
 
 logging.basicConfig()
-logger = logging.getLogger()
+logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-from botocore.exceptions import ClientError
-from urllib.parse import unquote
-
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-# MySQL Standard Support End Dates (From AWS Docs)
-MYSQL_EOL = {
-    "5.7.44": "2025-03-01",
-    "8.0.34": "2025-03-01",
-    "8.0.35": "2025-03-01",
-    "8.0.36": "2025-03-01",
-    "8.0.37": "2025-09-01",
-    "8.0.39": "2025-09-01",
-    "8.0.40": "2026-03-01",
-    "8.4.3": "2026-03-01",
-}
-
-# PostgreSQL Standard Support End Dates (Major and Minor Versions)
-POSTGRES_EOL = {
-    "16.5": "2026-03-01","16.4": "2025-09-01","16.3": "2025-09-01","16.2": "2025-03-31","16.1": "2025-03-31",
-    "15.1": "2026-03-01","15.9": "2026-03-01","15.8": "2025-09-01","15.7": "2025-09-01","15.6": "2025-03-31","15.5": "2025-03-31","15.4": "2025-03-31",
-    "14.15": "2026-03-01","14.14": "2026-03-01","14.13": "2025-09-01","14.12": "2025-09-01","14.11": "2025-03-31","14.1": "2025-03-31","14.9": "2025-03-31",
-    "13.18": "2026-02-28","13.17": "2026-02-28","13.16": "2025-09-01","13.15": "2025-09-01","13.14": "2025-03-31","13.13": "2025-03-31","13.12": "2025-03-31","13.11": "2025-03-31",
-    "12.22": "2025-02-28","12.21": "2025-02-28","12.2": "2025-02-28","12.19": "2025-02-28","12.18": "2025-02-28","12.17": "2025-02-28","12.16": "2025-02-28","12.15": "2025-02-28",
-}
-# Aurora MySQL Standard Support End Dates (Major and Minor Versions)
-AURORA_MYSQL_EOL = {
-    "5.7.mysql_aurora.2.12.2": "2024-10-31",
-    "5.7.mysql_aurora.2.11.5": "2024-10-31",
-    "5.7.mysql_aurora.2.11.2": "2024-10-31",
-    "8.0.mysql_aurora.3.08.0": "2027:04:30",
-    "8.0.mysql_aurora.3.07.0": "2027:04:30",
-    "8.0.mysql_aurora.3.06.0": "2027:04:30",
-    "8.0.mysql_aurora.3.05.2": "2027:04:30",
-    "8.0.mysql_aurora.3.05.0": "2027:04:30",
-    "8.0.mysql_aurora.3.04.0": "2027:04:30"
-}
-
-# Aurora PostgreSQL Standard Support End Dates (Major and Minor Versions)
-AURORA_POSTGRES_EOL = {
-    "16.6": "2026-05-31","16.4": "2026-05-01","16.3": "2025-10-01","16.2": "2025-10-01","16.1": "2025-10-01",
-    "15.1": "2026-05-31","15.8": "2026-05-01","15.7": "2025-10-01","15.6": "2025-10-01","15.5": "2025-05-01","15.4": "2025-05-01","15.3": "2025-05-01","15.2": "2024-11-15",
-    "14.15": "2026-05-31","14.13": "2026-05-01","14.12": "2025-10-01","14.11": "2025-10-01","14.1": "2025-05-01","14.9": "2025-05-01",
-    "14.8": "2025-05-01","14.7": "2024-11-15","14.6": "2027-02-28","14.5": "2024-11-15","14.4": "2024-11-15","14.3": "2024-11-15",
-    "13.18": "2026-02-28","13.16": "2026-02-28","13.15": "2025-10-01","13.14": "2025-10-01",
-    "13.13": "2025-05-01","13.12": "2025-05-01","13.11": "2025-05-01","13.1": "2024-11-15","13.9": "2026-02-28","13.8": "2024-11-15","13.7": "2024-11-15",
-    "12.22": "2025-02-28","12.2": "2025-02-28",
-    "12.19": "2025-02-28","12.18": "2025-02-28","12.17": "2025-02-28","12.16": "2025-02-28","12.15": "2025-02-28","12.14": "2024-11-15","12.13": "2024-11-15","12.12": "2024-11-15","12.11": "2024-11-15","12.9": "2025-02-28"
-}
+def _version_key(version):
+    """Return a sortable key for a dotted engine version (numeric parts compare as numbers)."""
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part) for part in version.split("."))
+
+def validate_catalog(catalog):
+    """Raise ValueError if the EOS catalog is not {"version": ..., "engines": {engine: {version: "YYYY-MM-DD"}}}."""
+    errors = []
+    if not isinstance(catalog, dict) or "version" not in catalog or not isinstance(catalog.get("engines"), dict):
+        raise ValueError("EOS catalog must be an object with 'version' and 'engines'")
+    for engine, table in catalog["engines"].items():
+        if not isinstance(table, dict):
+            errors.append(f"{engine}: expected an object of version -> date")
+            continue
+        for version, value in table.items():
+            try:
+                dt.strptime(value, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                errors.append(f"{engine} {version}: invalid date {value!r}")
+    if errors:
+        raise ValueError("Invalid EOS catalog: " + "; ".join(errors))
+
+def compile_eos_index(engines):
+    """Build {engine: (exact {version: date}, [(version key, date)] sorted)} from {engine: {version: date}}."""
+    index = {}
+    for engine, table in engines.items():
+        exact = dict(table)
+        index[engine] = (exact, sorted((_version_key(version), eos) for version, eos in exact.items()))
+    return index
+
+def _read_catalog_cache(digest):
+    """Return the pre-parsed {engine: {version: date}} cached for this catalog content, if any."""
+    try:
+        data, _ = open_store(EOL_CATALOG_CACHE).read()
+        cache = json.loads(data) if data else None
+    except (ClientError, ValueError) as e:
+        logger.warning(f"Could not read EOS catalog cache {EOL_CATALOG_CACHE}: {e}")
+        return None
+    if not cache or cache.get("digest") != digest:
+        return None
+    # Dates are cached as ordinals, which load much faster than strptime
+    return {engine: {version: datetime.date.fromordinal(day) for version, day in table.items()}
+            for engine, table in cache["engines"].items()}
+
+def _write_catalog_cache(digest, engines):
+    """Store the parsed catalog next to it so later cold starts can skip validation and parsing."""
+    cache = {
+        "digest": digest,
+        "engines": {engine: {version: eos.toordinal() for version, eos in table.items()} for engine, table in engines.items()},
+    }
+    try:
+        open_store(EOL_CATALOG_CACHE).write(json.dumps(cache, separators=(",", ":")).encode())
+    except (ClientError, OSError) as e:
+        logger.warning(f"Could not write EOS catalog cache {EOL_CATALOG_CACHE}: {e}")
+
+# Engine -> parsed EOS dates; kept across warm Lambda invocations
+EOS_INDEX = None
+_eos_catalog_stamp = None
+
+def load_eos_index():
+    """Load the EOS catalog into EOS_INDEX, only re-reading it when its ETag or mtime has changed."""
+    global EOS_INDEX, _eos_catalog_stamp
+    store = open_store(EOL_CATALOG)
+    stamp = store.stamp()
+    if EOS_INDEX is not None and stamp == _eos_catalog_stamp:
+        return EOS_INDEX
+
+    data, stamp = store.read()
+    if data is None:
+        raise FileNotFoundError(f"EOS catalog not found: {store!r}")
+    # Keyed by content rather than mtime, so a cache shipped with the package stays valid after deployment
+    digest = hashlib.sha256(data).hexdigest()
+    engines = _read_catalog_cache(digest)
+    if engines is None:
+        catalog = json.loads(data)
+        validate_catalog(catalog)
+        engines = {engine: {version: dt.strptime(value, "%Y-%m-%d").date() for version, value in table.items()}
+                   for engine, table in catalog["engines"].items()}
+        _write_catalog_cache(digest, engines)
+        print(f"Loaded EOS catalog {catalog['version']} from {store!r}")
+
+    EOS_INDEX = compile_eos_index(engines)
+    _eos_catalog_stamp = stamp
+    get_eol.cache_clear()
+    return EOS_INDEX
+
+# Function to resolve tags for many RDS instances at once
+def resolve_instance_tags(region, instances, account_id=None):
+    """Return {arn: tags} for the given instances using as few API calls as possible.
+
+    Tags come from the TagList returned by describe_db_instances where present, then
+    from the shared tag cache, then from batched Resource Groups Tagging API lookups,
+    and only as a last resort from per-instance list_tags_for_resource calls.
+    """
+    tags_by_arn = {}
+    missing = []
+    api_calls = 0
 
-# Function to fetch RDS instances across all AWS regions
-def get_rds_instances():
-    """Fetch all RDS instances, including their tags, and return their details."""
-    client = boto3.client("ec2")
-    regions = [region["RegionName"] for region in client.describe_regions()["Regions"]]
-
-    rds_instances = []
-    for region in regions:
-        rds_client = boto3.client("rds", region_name=region)
-        response = rds_client.describe_db_instances()
-
-        for instance in response["DBInstances"]:
-            instance_id = instance["DBInstanceIdentifier"]
-            
-            # Fetch instance tags
-            tags_response = rds_client.list_tags_for_resource(
-                ResourceName=instance["DBInstanceArn"]
-            )
-            tags = {tag["Key"]: tag["Value"] for tag in tags_response.get("TagList", [])}
+    for instance in instances:
+        if "TagList" in instance:
+            tags_by_arn[instance["DBInstanceArn"]] = {tag["Key"]: tag["Value"] for tag in instance["TagList"]}
+        else:
+            missing.append(instance["DBInstanceArn"])
+
+    if missing:
+        fetched, api_calls = get_rds_tags(region, missing, account_id)
+        tags_by_arn.update(fetched)
+
+    with _tag_stats_lock:
+        TAG_LOOKUP_STATS["instances"] += len(instances)
+        TAG_LOOKUP_STATS["api_calls"] += api_calls
+
+    return tags_by_arn
+
+# Pipeline stage: page through describe_db_instances
+def iter_db_instance_pages(region, account_id=None):
+    """Yield pages of raw DB instances for a region, following the pagination marker."""
+    paginator = get_client("rds", region, account_id).get_paginator("describe_db_instances")
+    for page in paginator.paginate():
+        yield page["DBInstances"]
+
+# Pipeline stage: attach the contact tag, one page at a time
+def enrich_instances(region, pages, account_id=None):
+    """Yield instance details with their contact tag, resolving tags in bulk per page."""
+    for page in pages:
+        # Fetch instance tags
+        tags_by_arn = resolve_instance_tags(region, page, account_id)
+
+        for instance in page:
+            tags = tags_by_arn.get(instance["DBInstanceArn"], {})
             contact_email = tags.get("contact", "Unknown")  # Extract 'contact' tag
 
-            # Store instance details
-            rds_instances.append({
-                "DBInstanceIdentifier": instance_id,
+            yield {
+                "DBInstanceIdentifier": instance["DBInstanceIdentifier"],
                 "Engine": instance["Engine"],
                 "EngineVersion": instance["EngineVersion"],  # Get full version (major + minor)
                 "Region": region,
+                "Account": account_id,  # None when only the current account is scanned
                 "Contact": contact_email,  # Add contact tag
-            })
+            }
+
+# Pipeline stage: look up the End-of-Support date
+def classify_instances(instances):
+    """Yield instances with an 'EOSDate' (a date, or None when unknown) added."""
+    for instance in instances:
+        if "EOSDate" not in instance:
+            instance["EOSDate"] = get_eol(instance["Engine"], instance["EngineVersion"])
+        yield instance
+
+# Pipeline stage: drop instances that do not need reporting yet
+def filter_reportable(instances):
+    """Yield only instances whose EOS is unknown or within the next 12 months."""
+    one_year_later = datetime.date.today() + datetime.timedelta(days=365)  # 12 months from today
+    for instance in instances:
+        # **Exclude instances whose EOS is more than 12 months away**
+        if instance["EOSDate"] is None or instance["EOSDate"] <= one_year_later:
+            yield instance
+
+# Function to fetch the reportable RDS instances for a single region
+def get_region_instances(region, account_id=None):
+    """Stream one region's RDS instances through the pipeline and keep only reportable ones."""
+    try:
+        pages = iter_db_instance_pages(region, account_id)
+        return list(filter_reportable(classify_instances(enrich_instances(region, pages, account_id))))
+    except ClientError as e:
+        print(f"Error fetching RDS instances in {region}{f' of {account_id}' if account_id else ''}: {e}")
+        return []
+
+def _encode_instances(instances):
+    """Make a region's instances JSON-serializable for a checkpoint; EOS dates are looked up again."""
+    return [{key: value for key, value in instance.items() if key != "EOSDate"} for instance in instances]
+
+# Function to fetch RDS instances across all AWS regions
+def get_rds_instances(scheduler=None):
+    """Fetch the RDS instances due for an EOS notice, including their tags, scanning regions in parallel.
+
+    Instances whose EOS is more than 12 months away are discarded while streaming,
+    so memory use follows the size of the report rather than the fleet. With ORG_ACCOUNTS
+    set, every (account, region) pair of the listed accounts is scanned on one pool.
+    Each region (or pair) is a unit of the scheduler; returns None when the Lambda
+    deadline stopped the scan, with the finished units checkpointed.
+    """
+    TAG_LOOKUP_STATS.update(instances=0, api_calls=0)
+    get_tag_cache().reset_stats()
+    scheduler = scheduler or DeadlineScheduler("rds_eol_checker")
+
+    accounts = get_scan_accounts()
+    if accounts:
+        pairs = list_account_regions(accounts)
+        scan_pair = releasing_clients(lambda account_id, region: get_region_instances(region, account_id),
+                                      scheduler.pending(pairs))
+        results = scheduler.run(pairs, scan_pair, ORG_MAX_WORKERS, encode=_encode_instances)
+    else:
+        # Results come back in region order, however long each region takes
+        results = scheduler.run(get_regions(), get_region_instances, MAX_WORKERS, encode=_encode_instances)
+
+    # One list_tags_for_resource call per instance is what the scan used to cost
+    saved = TAG_LOOKUP_STATS["instances"] - TAG_LOOKUP_STATS["api_calls"]
+    print(f"Resolved tags for {TAG_LOOKUP_STATS['instances']} instances with "
+          f"{TAG_LOOKUP_STATS['api_calls']} API calls ({saved} calls saved).")
+    get_tag_cache().report()
+
+    if results is None:
+        return None
+    return [instance for region_instances in results for instance in region_instances]
+
+# Shard worker: scan a slice of the regions or accounts
+def scan_shard(shard):
+    """Scan a shard's accounts (organization scans) or regions and return its reportable instances."""
+    if "accounts" in shard:
+        results = [result for _, result in scan_accounts(
+            lambda account_id, region: get_region_instances(region, account_id), shard["accounts"])]
+    else:
+        results = scan_regions(get_region_instances, shard["regions"], MAX_WORKERS)
+    return [instance for region_instances in results for instance in _encode_instances(region_instances)]
 
-            # Add contact to recipient list if it's a valid email
-            if "@" in contact_email:
-                RECIPIENT_EMAILS.add(contact_email)
+# Coordinator: fan the scan out to SHARD_COUNT workers and merge what they found
+def get_rds_instances_sharded(context=None, initializer=None, initargs=()):
+    """Scan the regions (or accounts) in SHARD_COUNT shards and merge their instances.
 
-    return rds_instances
+    Duplicates are dropped and the instances come back in account, region and
+    identifier order, ready for create_rds_table.
+    """
+    accounts = get_scan_accounts()
+    if accounts:
+        shards = plan_shards("rds_eol_checker", accounts, SHARD_COUNT, "accounts")
+    else:
+        shards = plan_shards("rds_eol_checker", get_regions(), SHARD_COUNT, "regions")
+    dispatch_shards(scan_shard, shards, context, initializer, initargs)
+    return merge_shard_results(
+        shards, key=lambda instance: (instance.get("Account") or "", instance["Region"], instance["DBInstanceIdentifier"]))
 
 # Function to get End-of-Support date for an engine/version
+@lru_cache(maxsize=None)
 def get_eol(engine, version):
-    """Return the end-of-support date for a given engine and version."""
-    EOL_MAPPINGS = {
-        "mysql": MYSQL_EOL,
-        "postgres": POSTGRES_EOL,
-        "aurora-mysql": AURORA_MYSQL_EOL,
-        "aurora-postgresql": AURORA_POSTGRES_EOL,
-    }
-    return EOL_MAPPINGS.get(engine, {}).get(version, "Unknown")
+    """Return the end-of-support date for a given engine and version, or None if unknown.
+
+    Versions missing from the tables resolve to the nearest known version of the same
+    minor line, then the same major line (e.g. postgres 16.7 -> 16.5).
+    """
+    index = EOS_INDEX if EOS_INDEX is not None else load_eos_index()
+    exact, ordered = index.get(engine, ({}, []))
+    if version in exact:
+        return exact[version]
+
+    key = _version_key(version)
+    for depth in range(len(key) - 1, 0, -1):
+        candidates = [entry for entry in ordered if entry[0][:depth] == key[:depth]]
+        if candidates:
+            # Prefer the closest older version, otherwise the oldest newer one
+            older = [entry for entry in candidates if entry[0] <= key]
+            return (older[-1] if older else candidates[0])[1]
+    return None
 
 # Function to create the table of instances with their engine version, EOL date, and contact
 def create_rds_table(instances):
-    """Create a formatted table of RDS instances with engine version, EOL date, and contact."""
-    today = datetime.date.today()
-    one_year_later = today + datetime.timedelta(days=365)  # 12 months from today
+    """Create a formatted table of RDS instances with engine version, EOL date, contact and account (None outside org scans)."""
     table = []
 
-    for instance in instances:
-        engine = instance["Engine"]
-        version = instance["EngineVersion"]
-        region = instance["Region"]
-        contact = instance["Contact"]
-
-        # Get EOL date for each engine/version
-        eos_date = get_eol(engine, version)
-
-        # Normalize date format if necessary (e.g., 2027:04:30 -> 2027-04-30)
-        if eos_date != "Unknown":
-            eos_date = eos_date.replace(":", "-")  # Replace colon with dash if needed
-            eos_date_dt = dt.strptime(eos_date, "%Y-%m-%d").date()
-            
-            # **Exclude instances whose EOS is more than 12 months away**
-            if eos_date_dt > one_year_later:
-                continue  # Skip this instance
-            
-            # Highlight EOL < 3 months in red
-            if eos_date_dt < today + datetime.timedelta(days=90):
-                eos_date = f"<span style='color:red;'>{eos_date}</span>"
-
-        table.append([instance["DBInstanceIdentifier"], engine, version, eos_date, contact])
+    # Rows keep the EOS date as a date (or None) so nothing downstream re-parses it
+    for instance in filter_reportable(classify_instances(instances)):
+        table.append([instance["DBInstanceIdentifier"], instance["Engine"], instance["EngineVersion"], instance["EOSDate"], instance["Contact"],
+                      instance.get("Account")])
 
     return table
 
 # Function to send email with table via SES
-def send_email_with_table(table, recipient_emails):
-    """Send the RDS table via AWS SES with an alert message and proper HTML formatting."""
-    
+def render_rds_report(table):
+    """Render the RDS table as the HTML email body, in one pass with escaped cells."""
     today = datetime.date.today()
-    
-    # Construct HTML table with proper formatting
-    table_html = """
-    <table border="1" cellspacing="0" cellpadding="5" style="border-collapse: collapse; width: 100%;">
-        <thead>
-            <tr style="background-color: #f2f2f2;">
-                <th>DB Instance Identifier</th>
-                <th>Engine</th>
-                <th>Version</th>
-                <th>End of Support Date</th>
-                <th>Contact</th>
-            </tr>
-        </thead>
-        <tbody>
-    """
-    
-    for row in table:
-        db_instance, engine, version, eos_date, contact = row
-        
-        # Convert EOS date to datetime object for comparison
-        try:
-            eos_date_dt = dt.strptime(eos_date, "%Y-%m-%d") if eos_date != "Unknown" else None
-        except ValueError:
-            eos_date_dt = None  # Handle invalid date formats
-        
-        # Check if EOS date is within 3 months
-        if eos_date_dt and eos_date_dt.date() < today + datetime.timedelta(days=90):
-            row_color = " style='color: red; font-weight: bold;'"  # Highlight in red
-        else:
-            row_color = ""
-
-        table_html += f"""
-            <tr>
-                <td>{db_instance}</td>
-                <td>{engine}</td>
-                <td>{version}</td>
-                <td{row_color}>{eos_date}</td>
-                <td>{contact}</td>
-            </tr>
-        """
-
-    table_html += """
-        </tbody>
-    </table>
-    """
+    report = HtmlReport("rds_end_of_support")
 
-    # Email message body
-    message_body = f"""
+    report.raw("""
     <html>
     <body>
         <p><strong>Alert:</strong> The following AWS RDS instances are approaching their End-of-Support (EOS) date.</p>
         <p>Instances with EOS less than <strong>3 months</strong> are highlighted in <span style="color:red;">red</span>.</p>
-        {table_html}
+    """)
+
+    headers = ["DB Instance Identifier", "Engine", "Version", "End of Support Date", "Contact"]
+    # The account column only appears in organization scans
+    with_account = any(row[5] for row in table)
+    if with_account:
+        headers.append("Account")
+    with report.table(headers, header_row_attrs='style="background-color: #f2f2f2;"') as rows:
+        for db_instance, engine, version, eos_date_dt, contact, account_id in table:
+            eos_date = eos_date_dt.isoformat() if eos_date_dt else "Unknown"
+
+            # Check if EOS date is within 3 months
+            if eos_date_dt and eos_date_dt < today + datetime.timedelta(days=90):
+                row_color = "style='color: red; font-weight: bold;'"  # Highlight in red
+            else:
+                row_color = ""
+
+            cells = [db_instance, engine, version, eos_date, contact]
+            if with_account:
+                cells.append(account_id)
+            rows.row(cells, ["", "", "", row_color, "", ""])
+
+    report.raw("""
         <p><strong>Action Required:</strong> Please review these instances and plan necessary upgrades before the support ends.</p>
         <p>Regards,</p>
         <p><strong>CLoud Alerts</strong></p>
     </body>
     </html>
-    """
-
-    # Convert recipient set to list
-    recipient_list = list(recipient_emails)
-
-    # Create SES client
-    ses_client = boto3.client("ses", region_name=AWS_REGION)
+    """)
+    return report.render()
 
-    # Send email
-    response = ses_client.send_email(
-        Source=SENDER_EMAIL,
-        Destination={
-            "ToAddresses": recipient_list,
-        },
-        Message={
-            "Subject": {
-                "Data": SUBJECT,
-            },
-            "Body": {
-                "Html": {
-                    "Data": message_body,
-                },
-            },
-        },
-    )
+def send_reports(table):
+    """Send the full table to RECIPIENT_EMAILS and a digest of their own instances to each contact."""
+    messages = []
+    default_recipients = sorted(email for email in RECIPIENT_EMAILS if email)
+    if default_recipients:
+        messages.append((default_recipients, SUBJECT, render_rds_report(table)))
 
-    print(f"Email sent! Message ID: {response['MessageId']}")
+    # One digest per owner, from the 'contact' tag column
+    for contact, rows in partition_by_contact(table, lambda row: row[4]).items():
+        messages.append(([contact], SUBJECT, render_rds_report(rows)))
 
+    deliver_messages(get_client("ses", AWS_REGION), SENDER_EMAIL, messages, SEND_WORKERS)
 
+@profile_handler("rds_eol_checker")
+@emit_metrics("rds_eol_checker")
+def lambda_handler(event, context):
+    # Pick up catalog changes between warm invocations
+    load_eos_index()
 
+    # Invoked by a coordinator to scan one shard
+    shard = shard_from_event(event)
+    if shard is not None:
+        return {"rows": run_shard(scan_shard, shard)}
 
-def lambda_handler(event, context):
-    # Fetch RDS instances
-    instances = get_rds_instances()
+    if SHARD_COUNT > 1:
+        instances = get_rds_instances_sharded(context)
+    else:
+        # Fetch RDS instances, stopping with a checkpoint if the Lambda deadline gets close
+        scheduler = DeadlineScheduler("rds_eol_checker", event, context)
+        instances = get_rds_instances(scheduler)
+        if instances is None:
+            return scheduler.suspend()
 
     # Create RDS table
     rds_table = create_rds_table(instances)
     
     if rds_table:  # Only send email if the list is not empty
-        send_email_with_table(rds_table, RECIPIENT_EMAILS)  # Your function to send the email
+        send_reports(rds_table)  # Full report plus per-contact digests
     else:
         print("✅ No unsupported RDS instances found. Skipping email.")
 
-    # Send the table via email to all collected recipients
-    #send_email_with_table(rds_table, RECIPIENT_EMAILS)
-
 if __name__ == "__main__":
-    lambda_handler([], [])
\ No newline at end of file
+    if sys.argv[1:] == ["--build-catalog-cache"]:
+        load_eos_index()  # Writes EOL_CATALOG_CACHE, to ship with the catalog
+    else:
+        lambda_handler([], [])
\ No newline at end of file
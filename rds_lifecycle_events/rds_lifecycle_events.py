@@ -1,138 +1,188 @@
-import boto3
+import html
+import json
 import logging
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared aws_common package
+
+from aws_common.clients import get_client
+from aws_common.eventstate import get_event_state
+from aws_common.health import (
+    fetch_event_details,
+    group_affected_entities,
+    iter_affected_entities,
+    parse_health_notification,
+)
+from aws_common.mail import send_html_email
+from aws_common.metrics import emit_metrics
+from aws_common.profiling import profile_handler
+from aws_common.report import HtmlReport
+from aws_common.tagcache import get_tag_cache
+from aws_common.tags import get_rds_tags
 
 # AWS Clients
 ENV = os.getenv('ENV')
-health_client = boto3.client('health', region_name="us-east-1")
-ses_client = boto3.client('ses', region_name='ap-southeast-2')  # Change if needed
+HEALTH_REGION = "us-east-1"  # AWS Health API endpoint region
+SES_REGION = os.getenv("SES_REGION", "ap-southeast-2")  # Region where SES is configured
 
 # SES Configurations
 SENDER_EMAIL = ""  # Replace with verified SES sender email
 DEFAULT_RECIPIENT_EMAIL = ""  # Default recipient email
 
 SUBJECT = f"AWS RDS {ENV} Account - LifeCycle Event"
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))  # Regions whose tags are resolved in parallel
 
 logging.basicConfig()
-logger = logging.getLogger()
+logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+def get_health_client():
+    """Return the AWS Health client, created on first use and reused across warm invocations."""
+    return get_client('health', HEALTH_REGION)
+
+def get_ses_client():
+    """Return the SES client, created on first use and reused across warm invocations."""
+    return get_client('ses', SES_REGION)
+
+def list_events(since=None):
+    """Fetch upcoming RDS Planned Lifecycle events, or with since, every one updated since then."""
+    event_filter = {"eventTypeCodes": ["AWS_RDS_PLANNED_LIFECYCLE_EVENT"]}
+    if since is None:
+        event_filter["eventStatusCodes"] = ["upcoming"]
+    else:
+        event_filter["lastUpdatedTimes"] = [{"from": since}]
+    events = []
+    for page in get_health_client().get_paginator("describe_events").paginate(filter=event_filter):
+        events.extend(page.get("events", []))
+    return events
 
 def get_rds_lifecycle_events():
-    """Fetch upcoming AWS RDS Planned Lifecycle events."""
-    response = health_client.describe_events(
-        filter={"eventStatusCodes": ["upcoming"], "eventTypeCodes": ["AWS_RDS_PLANNED_LIFECYCLE_EVENT"]}
-    )
-    return response.get("events", [])
-
-def get_affected_entities(event_arn):
-    """Fetch affected resources for a given event."""
-    response = health_client.describe_affected_entities(filter={"eventArns": [event_arn]})
-    return [entity["entityValue"] for entity in response.get("entities", [])]
+    """Return the upcoming AWS RDS Planned Lifecycle events.
 
-def get_event_description(event_arn):
-    """Fetch detailed event description separately."""
-    try:
-        response = health_client.describe_event_details(eventArns=[event_arn])
-        if response.get("successfulSet"):
-            description_text = response["successfulSet"][0]["eventDescription"].get("latestDescription", "No details provided")
-            return "<p><b>Event Description:</b></p><p>" + description_text.replace("\n", "<br>") + "</p>"
-    except Exception as e:
-        print(f"Error fetching event description: {e}")
+    Only events updated since the last run are listed; the rest come from the event state.
+    """
+    return get_event_state("rds_lifecycle_events").refresh(list_events)
+
+def get_affected_entities(event_arns):
+    """Fetch affected resources for all given events as {event_arn: [resources]}."""
+    return group_affected_entities(iter_affected_entities(get_health_client(), event_arns))
+
+def fetch_event_data(event_arns):
+    """Fetch descriptions (10 events per call) and affected resources for new or updated events."""
+    event_details = fetch_event_details(get_health_client(), event_arns)
+    event_entities = get_affected_entities(event_arns)
+    return {
+        arn: {
+            # None when the details could not be fetched
+            "description": event_details[arn].get("eventDescription", {}).get("latestDescription", "No details provided")
+            if arn in event_details else None,
+            "entities": event_entities.get(arn, []),
+        }
+        for arn in event_arns
+    }
+
+def get_event_description(description_text):
+    """Format an event description, or None when its details could not be fetched, as HTML."""
+    if description_text is not None:
+        return "<p><b>Event Description:</b></p><p>" + html.escape(description_text).replace("\n", "<br>") + "</p>"
     return "<p><b>Event Description:</b> No details provided.</p>"
 
-def get_resource_tags(resource_arn, region):
-    """Fetch the 'contact' tag for an RDS resource."""
-    contact = "N/A"
+def get_region_contacts(region, resource_arns):
+    """Fetch the 'contact' tag for many RDS resources in one region, 100 ARNs per request."""
+    tags_by_arn, _ = get_rds_tags(region, resource_arns)
+    contacts = {}
+    for resource_arn in resource_arns:
+        tags = {key.lower(): value for key, value in tags_by_arn.get(resource_arn, {}).items()}
+        contacts[resource_arn] = tags.get("contact", "N/A")  # Fetch "contact" tag
+    return contacts
 
-    # Create RDS client for the region
-    rds_client = boto3.client('rds', region_name=region)
+def get_resource_contacts(resources, contacts=None):
+    """Resolve the 'contact' tag for (resource_arn, region) pairs as {resource_arn: contact}.
 
-    if ":rds:" in resource_arn:
-        try:
-            response = rds_client.list_tags_for_resource(ResourceName=resource_arn)
-            tags = {tag['Key'].lower(): tag['Value'] for tag in response.get('TagList', [])}
-            contact = tags.get("contact", "N/A")  # Fetch "contact" tag
-        except Exception as e:
-            print(f"Error fetching RDS tags for {resource_arn}: {e}")
-
-    return contact
-
-def format_html_message(events):
-    """Format the AWS RDS events data into an HTML email, adding contacts to recipient list."""
+    Resources are grouped by region and each region is resolved in bulk, with regions running
+    concurrently. ARNs already present in contacts (the memo for this invocation) are skipped.
+    """
+    contacts = {} if contacts is None else contacts
+    arns_by_region = {}
+    for resource_arn, region in resources:
+        if resource_arn in contacts:
+            continue
+        if ":rds:" not in resource_arn:
+            contacts[resource_arn] = "N/A"
+            continue
+        arns_by_region.setdefault(region, {})[resource_arn] = None
+
+    if arns_by_region:
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(arns_by_region)))) as pool:
+            for region_contacts in pool.map(lambda item: get_region_contacts(item[0], list(item[1])), arns_by_region.items()):
+                contacts.update(region_contacts)
+    return contacts
+
+def format_html_message(events, event_data=None):
+    """Format the AWS RDS events data into an HTML email, adding contacts to recipient list.
+
+    event_data ({event_arn: {"description", "entities"}}) is read from the event state when not given.
+    """
     if not events:
         return "<p>No upcoming AWS RDS Planned Lifecycle Events.</p>", []  # Ensure two values are always returned
 
     distinct_contacts = set()
-    event_descriptions = []
-    table_header = """
-    <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; width: 100%;">
-        <thead>
-            <tr>
-                <th>Event</th>
-                <th>Service</th>
-                <th>Region</th>
-                <th>Start Time</th>
-                <th>Affected Resource</th>
-                <th>Contact</th>
-            </tr>
-        </thead>
-        <tbody>
-    """
-    
-    table_rows = []
 
+    # Descriptions and affected resources from the event state, fetched only for new or updated events
+    # Events whose description could not be fetched are fetched again next run
+    if event_data is None:
+        event_data = get_event_state("rds_lifecycle_events").fetch_missing(
+            [event["arn"] for event in events], fetch_event_data, complete=lambda data: data["description"] is not None
+        )
+    event_entities = {arn: data["entities"] for arn, data in event_data.items()}
+
+    # Contact tags for every affected resource, grouped by region and looked up once per ARN
+    resource_contacts = get_resource_contacts(
+        (resource, event.get('region', 'us-east-1')) for event in events for resource in event_entities.get(event["arn"], [])
+    )
+
+    report = HtmlReport("rds_lifecycle_events")
+
+    # Event descriptions come first, then one table row per affected resource
     for event in events:
-        event_arn = event["arn"]
-        event_region = event.get('region', 'us-east-1')  # Default to us-east-1 if missing
-        affected_resources = get_affected_entities(event_arn)
-        event_description = get_event_description(event_arn)  # Fetch event description
-        event_descriptions.append(event_description)  # Store descriptions separately
-
-        for resource in affected_resources:
-            contact = get_resource_tags(resource, event_region)  # Get RDS contact tag
-
-            # Add contact email to recipient list (if valid)
-            if "@" in contact and "." in contact:
-                distinct_contacts.add(contact)
-
-            table_row = f"""
-            <tr>
-                <td>{event['eventTypeCode']}</td>
-                <td>{event['service']}</td>
-                <td>{event_region}</td>
-                <td>{event.get('startTime', 'Unknown')}</td>
-                <td>{resource}</td>
-                <td>{contact}</td>
-            </tr>
-            """
-            table_rows.append(table_row)
-
-    table_footer = "</tbody></table>"
-    description_section = "".join(event_descriptions)
-
-    return description_section + table_header + "".join(table_rows) + table_footer, list(distinct_contacts)
+        report.raw(get_event_description(event_data[event["arn"]]["description"]))
+
+    headers = ["Event", "Service", "Region", "Start Time", "Affected Resource", "Contact"]
+    with report.table(headers) as rows:
+        for event in events:
+            event_region = event.get('region', 'us-east-1')  # Default to us-east-1 if missing
+            for resource in event_entities.get(event["arn"], []):
+                contact = resource_contacts[resource]  # Get RDS contact tag
+
+                # Add contact email to recipient list (if valid)
+                if "@" in contact and "." in contact:
+                    distinct_contacts.add(contact)
+
+                rows.row([event['eventTypeCode'], event['service'], event_region,
+                          event.get('startTime', 'Unknown'), resource, contact])
+
+    return report.render(), list(distinct_contacts)
 
 def send_email(subject, body_html, recipient_list):
-    """Send HTML email using AWS SES with multiple recipients."""
+    """Send HTML email using AWS SES with multiple recipients; return whether it was sent."""
     try:
-        response = ses_client.send_email(
-            Source=SENDER_EMAIL,
-            Destination={'ToAddresses': recipient_list},
-            Message={
-                'Subject': {'Data': subject},
-                'Body': {'Html': {'Data': body_html}},
-            }
-        )
+        # Sent as a raw message when the full table is attached
+        response = send_html_email(get_ses_client(), SENDER_EMAIL, recipient_list, subject, body_html)
         print(f"Email sent! Message ID: {response['MessageId']} to {recipient_list}")
+        return True
     except Exception as e:
         print(f"Error sending email: {e}")
+        return False
 
+@profile_handler("rds_lifecycle_events")
+@emit_metrics("rds_lifecycle_events")
 def lambda_handler(event, context):
+    get_tag_cache().reset_stats()
     events = get_rds_lifecycle_events()
     html_message, contact_list = format_html_message(events)
+    get_tag_cache().report()
 
     # Add default recipient if no contacts found
     if not contact_list:
@@ -140,5 +190,55 @@ def lambda_handler(event, context):
 
     send_email(SUBJECT, html_message, contact_list)
 
+@profile_handler("rds_lifecycle_events")
+@emit_metrics("rds_lifecycle_events")
+def eventbridge_handler(event, context):
+    """Handle one RDS lifecycle event pushed by EventBridge: update the event state and notify that event's contacts."""
+    try:
+        health_event, description, entities = parse_health_notification(event)
+    except ValueError as e:
+        print(f"Ignoring event: {e}")
+        return
+    event_arn = health_event["arn"]
+    if not health_event["eventTypeCode"].startswith("AWS_RDS_PLANNED_LIFECYCLE_EVENT"):
+        print(f"Ignoring {health_event['eventTypeCode']} event {event_arn}.")
+        return
+
+    # The notification usually carries the description and entities; the API is only asked when it does not
+    if description is None or entities is None:
+        event_data = fetch_event_data([event_arn])[event_arn]
+    else:
+        event_data = {"description": description, "entities": [entity["entityValue"] for entity in entities]}
+
+    state = get_event_state("rds_lifecycle_events")
+    if health_event.get("statusCode", "upcoming") != "upcoming":
+        state.put(health_event, event_data)
+        print(f"Event {event_arn} is {health_event.get('statusCode')}, removed from the event state.")
+        return
+    if state.is_current(health_event):
+        print(f"Event {event_arn} is unchanged, already notified.")
+        return
+
+    # Contacts are resolved for this event's resources only
+    get_tag_cache().reset_stats()
+    html_message, contact_list = format_html_message([health_event], {event_arn: event_data})
+    get_tag_cache().report()
+
+    if not contact_list:
+        contact_list.append(DEFAULT_RECIPIENT_EMAIL)
+
+    if not send_email(SUBJECT, html_message, contact_list):
+        # Not stored yet, so the retried invocation notifies again
+        raise RuntimeError(f"Notification for event {event_arn} was not sent")
+    # Stored once notified; without a description it is not, so that the next poll fetches it again
+    if event_data["description"] is not None:
+        state.put(health_event, event_data)
+
 if __name__ == "__main__":
-    lambda_handler([], [])
+    # With sample EventBridge payloads as arguments, run the push handler on each
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            with open(path) as f:
+                eventbridge_handler(json.load(f), None)
+    else:
+        lambda_handler([], [])